@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, request, current_app
 from app import db
-from app.services import ProjectService, RefreshService, SchedulerService
+from app.services import (
+    ProjectService, RefreshService, SchedulerService, GitHubService, RefreshQueueFull, split_keywords
+)
 from app.models import GitHubProject, RefreshLog, ApiStats, SchedulerConfig
 from datetime import datetime, timedelta, timezone
 
@@ -21,6 +23,7 @@ def api_projects():
         keyword = request.args.get('keyword')
         owner = request.args.get('owner')
         language = request.args.get('language')
+        keyword_set = request.args.get('keyword_set')
         sort_by = request.args.get('sort', 'stars_count')
         order = request.args.get('order', 'desc')
         per_page = request.args.get('per_page', 20, type=int)
@@ -35,7 +38,8 @@ def api_projects():
             sort_by=sort_by,
             order=order,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            keyword_set=keyword_set
         )
         
         return jsonify({
@@ -83,29 +87,100 @@ def api_project_detail(project_id):
             'message': str(e)
         }), 500
 
+@bp.route('/projects/<int:project_id>/stars')
+def api_project_star_history(project_id):
+    """获取项目星标历史API（按天汇总，只包含指标有变化的日期）"""
+    try:
+        project = GitHubProject.query.get(project_id)
+        if not project:
+            return jsonify({
+                'status': 'error',
+                'message': 'Project not found'
+            }), 404
+        
+        days = request.args.get('days', type=int)
+        snapshots = ProjectService.get_star_history(project_id, days)
+        
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'project_id': project.id,
+                'full_name': project.full_name,
+                'series': [snapshot.to_dict() for snapshot in snapshots]
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@bp.route('/projects/rehydrate', methods=['POST'])
+def api_rehydrate_projects():
+    """通过GraphQL批量回填已跟踪项目API"""
+    try:
+        data = request.get_json() or {}
+        limit = data.get('limit')
+        
+        ProjectService.enqueue_rehydrate(limit=int(limit) if limit else None)
+        
+        return jsonify({
+            'status': 'success',
+            'message': '回填任务已提交'
+        }), 202
+        
+    except RefreshQueueFull as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 503
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 @bp.route('/refresh', methods=['POST'])
 def api_refresh():
     """手动刷新API"""
     try:
         data = request.get_json() or {}
         keyword = data.get('keyword', current_app.config['DEFAULT_SEARCH_KEYWORD'])
+        # 多个关键词作为一次批量刷新执行：关键词列表，或逗号分隔的字符串
+        keywords = data.get('keywords')
+        if keywords:
+            if isinstance(keywords, str):
+                keywords = [keywords]
+            if not isinstance(keywords, list) or not all(isinstance(item, str) for item in keywords):
+                return jsonify({
+                    'status': 'error',
+                    'message': 'keywords必须是字符串列表或逗号分隔的字符串'
+                }), 400
+            keyword = ','.join(keywords)
+            if not split_keywords(keyword):
+                return jsonify({
+                    'status': 'error',
+                    'message': 'keywords不能为空'
+                }), 400
         
-        refresh_log = RefreshService.manual_refresh(keyword)
+        refresh_log = RefreshService.enqueue_refresh('manual', keyword)
         
         return jsonify({
             'status': 'success',
             'data': {
                 'refresh_id': refresh_log.id,
                 'status': refresh_log.status,
-                'keyword': refresh_log.keyword,
-                'new_projects': refresh_log.new_projects,
-                'updated_projects': refresh_log.updated_projects,
-                'total_fetched': refresh_log.total_fetched,
-                'duration_seconds': refresh_log.duration_seconds,
-                'error_message': refresh_log.error_message
-            }
-        })
+                'keyword': refresh_log.keyword
+            },
+            'message': '刷新任务已提交，可通过 /api/refresh/status/<id> 查询进度'
+        }), 202
         
+    except RefreshQueueFull as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 503
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -132,11 +207,59 @@ def api_refresh_status(refresh_id):
                 'status': refresh_log.status,
                 'new_projects': refresh_log.new_projects,
                 'updated_projects': refresh_log.updated_projects,
+                'unchanged_projects': refresh_log.unchanged_projects,
+                'failed_projects': refresh_log.failed_projects,
+                'failed_records': refresh_log.failed_records or [],
                 'total_fetched': refresh_log.total_fetched,
                 'start_time': refresh_log.start_time.isoformat() if refresh_log.start_time else None,
                 'end_time': refresh_log.end_time.isoformat() if refresh_log.end_time else None,
                 'duration_seconds': refresh_log.duration_seconds,
-                'error_message': refresh_log.error_message
+                'error_message': refresh_log.error_message,
+                'keyword_stats': refresh_log.keyword_stats,
+                'api_requests_count': refresh_log.api_requests_count,
+                'metrics': refresh_log.metrics,
+                'progress': refresh_log.progress()
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@bp.route('/refresh/<int:refresh_id>/changes')
+def api_refresh_changes(refresh_id):
+    """获取刷新变更流水API（after_id为上一页返回的next_after_id）"""
+    try:
+        refresh_log = RefreshLog.query.get(refresh_id)
+        if not refresh_log:
+            return jsonify({
+                'status': 'error',
+                'message': 'Refresh log not found'
+            }), 404
+        
+        after_id = request.args.get('after_id', type=int)
+        limit = min(request.args.get('limit', 100, type=int), 500)
+        change_type = request.args.get('type')
+        
+        rows = RefreshService.get_changes(refresh_id, after_id, limit, change_type)
+        changes = []
+        for change, project in rows:
+            item = change.to_dict()
+            item.update({
+                'full_name': project.full_name,
+                'html_url': project.html_url,
+                'language': project.language
+            })
+            changes.append(item)
+        
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'refresh_id': refresh_id,
+                'changes': changes,
+                'next_after_id': changes[-1]['id'] if len(changes) == limit else None
             }
         })
         
@@ -243,6 +366,23 @@ def api_languages():
             'message': str(e)
         }), 500
 
+@bp.route('/rate-limit')
+def api_rate_limit():
+    """获取GitHub API剩余额度API"""
+    try:
+        budget = GitHubService(max_wait=0).get_rate_limit_budget()
+        
+        return jsonify({
+            'status': 'success',
+            'data': budget
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 # 定时器配置API
 @bp.route('/scheduler/configs')
 def api_scheduler_configs():
@@ -412,16 +552,16 @@ def api_execute_scheduler_config(config_id):
             'data': {
                 'refresh_id': refresh_log.id,
                 'status': refresh_log.status,
-                'keyword': refresh_log.keyword,
-                'new_projects': refresh_log.new_projects,
-                'updated_projects': refresh_log.updated_projects,
-                'total_fetched': refresh_log.total_fetched,
-                'duration_seconds': refresh_log.duration_seconds,
-                'error_message': refresh_log.error_message
+                'keyword': refresh_log.keyword
             },
-            'message': '任务执行完成'
-        })
+            'message': '任务已提交'
+        }), 202
         
+    except RefreshQueueFull as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 503
     except ValueError as e:
         return jsonify({
             'status': 'error',
@@ -19,6 +19,7 @@ class GitHubProject(db.Model):
     owner = db.Column(db.String(255), nullable=False, comment='项目作者')
     description = db.Column(db.Text, comment='项目简介')
     html_url = db.Column(db.String(500), nullable=False, comment='GitHub项目地址')
+    node_id = db.Column(db.String(100), comment='GitHub GraphQL节点ID')
     stars_count = db.Column(db.Integer, default=0, comment='星标数量')
     forks_count = db.Column(db.Integer, default=0, comment='分叉数量')
     watchers_count = db.Column(db.Integer, default=0, comment='关注者数量')
@@ -45,6 +46,7 @@ class GitHubProject(db.Model):
     local_updated_at = db.Column(db.TIMESTAMP, default=china_now, onupdate=china_now, comment='本地更新时间')
     last_fetched_at = db.Column(db.TIMESTAMP, default=china_now, comment='最后抓取时间')
     fetch_count = db.Column(db.Integer, default=1, comment='抓取次数')
+    content_hash = db.Column(db.String(40), comment='跟踪字段的内容指纹(SHA1)')
     
     # 唯一约束
     __table_args__ = (
@@ -54,6 +56,7 @@ class GitHubProject(db.Model):
         db.Index('idx_stars', 'stars_count'),
         db.Index('idx_language', 'language'),
         db.Index('idx_updated_at', 'updated_at'),
+        db.Index('idx_node_id', 'node_id'),
     )
     
     def __repr__(self):
@@ -90,16 +93,162 @@ class RefreshLog(db.Model):
     total_fetched = db.Column(db.Integer, default=0, comment='获取的项目总数')
     new_projects = db.Column(db.Integer, default=0, comment='新增项目数')
     updated_projects = db.Column(db.Integer, default=0, comment='更新项目数')
+    unchanged_projects = db.Column(db.Integer, default=0, comment='未变化项目数')
+    failed_projects = db.Column(db.Integer, default=0, comment='写入失败项目数')
+    failed_records = db.Column(db.JSON, comment='写入失败的项目及原因')
     start_time = db.Column(db.TIMESTAMP, nullable=False, comment='开始时间')
     end_time = db.Column(db.TIMESTAMP, comment='结束时间')
     duration_seconds = db.Column(db.Integer, default=0, comment='耗时(秒)')
-    status = db.Column(db.Enum('running', 'success', 'failed'), default='running', comment='状态')
+    status = db.Column(db.Enum('queued', 'running', 'success', 'failed', 'deferred'), default='running', comment='状态')
     error_message = db.Column(db.Text, comment='错误信息')
     api_requests_count = db.Column(db.Integer, default=0, comment='API请求次数')
+    refresh_mode = db.Column(db.Enum('full', 'incremental'), default='full', comment='刷新模式')
+    pages_fetched = db.Column(db.Integer, default=0, comment='已抓取页数')
+    total_pages = db.Column(db.Integer, default=0, comment='预计总页数')
+    rows_written = db.Column(db.Integer, default=0, comment='已写入项目数')
+    keyword_stats = db.Column(db.JSON, comment='批量刷新中各关键词的抓取数/首次发现数/独有数')
+    checkpoint = db.Column(db.JSON, comment='刷新断点（查询、分片计划、各查询已写入的页码），成功后清空')
+    metrics = db.Column(db.JSON, comment='各阶段耗时、请求数、下载字节数、每秒写入行数、内存增量')
     created_at = db.Column(db.TIMESTAMP, default=china_now)
     
+    # failed_records最多保留的条数
+    MAX_FAILED_RECORDS = 100
+    
+    __table_args__ = (
+        db.Index('idx_keyword_status', 'keyword', 'status', 'start_time'),
+    )
+    
     def __repr__(self):
         return f'<RefreshLog {self.refresh_type} {self.keyword}>'
+    
+    def progress(self):
+        """刷新进度：已抓取/预计页数、完成比例和按当前速度估算的剩余秒数"""
+        pages_fetched = self.pages_fetched or 0
+        total_pages = self.total_pages or 0
+        percent = None
+        eta_seconds = None
+        if self.status in ('success', 'failed', 'deferred'):
+            percent = 100.0 if self.status == 'success' else None
+            eta_seconds = 0
+        elif total_pages:
+            percent = round(min(pages_fetched / total_pages, 1) * 100, 1)
+            if self.status == 'running' and pages_fetched and self.start_time:
+                elapsed = (china_now() - self.start_time).total_seconds()
+                eta_seconds = max(0, int(elapsed * (total_pages - pages_fetched) / pages_fetched))
+        
+        return {
+            'pages_fetched': pages_fetched,
+            'total_pages': total_pages,
+            'rows_written': self.rows_written or 0,
+            'percent': percent,
+            'eta_seconds': eta_seconds
+        }
+
+class RefreshLock(db.Model):
+    """刷新锁模型（同一关键词同时只允许一个刷新，租约过期后可被接管）"""
+    __tablename__ = 'refresh_locks'
+    
+    lock_key = db.Column(db.String(255), primary_key=True, comment='规范化后的关键词')
+    refresh_log_id = db.Column(db.Integer, nullable=False, comment='持有锁的刷新日志ID')
+    owner = db.Column(db.String(255), comment='持有锁的进程(主机:进程号:启动标记)')
+    acquired_at = db.Column(db.TIMESTAMP, nullable=False, comment='获得锁的时间')
+    lease_expires_at = db.Column(db.TIMESTAMP, nullable=False, comment='租约到期时间')
+    
+    @staticmethod
+    def normalize(keyword):
+        """关键词规范化：忽略首尾空白和大小写"""
+        return ' '.join(keyword.split()).lower()
+    
+    def __repr__(self):
+        return f'<RefreshLock {self.lock_key} {self.refresh_log_id}>'
+
+class SearchKeyword(db.Model):
+    """搜索关键词模型（规范化后唯一）"""
+    __tablename__ = 'search_keywords'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    keyword = db.Column(db.String(255), unique=True, nullable=False, comment='规范化后的关键词')
+    created_at = db.Column(db.TIMESTAMP, default=china_now)
+    
+    # 与刷新锁使用相同的关键词规范化规则
+    normalize = staticmethod(RefreshLock.normalize)
+    
+    def __repr__(self):
+        return f'<SearchKeyword {self.keyword}>'
+
+class ProjectKeyword(db.Model):
+    """项目与搜索关键词的对应关系（哪些关键词的刷新抓取到了该项目）"""
+    __tablename__ = 'project_keywords'
+    
+    # 复合主键 (keyword_id, project_id)：某关键词下的项目为一次主键范围扫描
+    keyword_id = db.Column(db.Integer, primary_key=True, autoincrement=False, comment='关键词ID')
+    project_id = db.Column(db.Integer, primary_key=True, autoincrement=False, comment='项目ID')
+    first_seen_at = db.Column(db.TIMESTAMP, default=china_now, comment='首次被该关键词抓取的时间')
+    last_seen_at = db.Column(db.TIMESTAMP, default=china_now, comment='最近一次被该关键词抓取的时间')
+    
+    __table_args__ = (
+        db.Index('idx_project_id', 'project_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ProjectKeyword {self.keyword_id} {self.project_id}>'
+
+class ProjectSnapshot(db.Model):
+    """项目指标快照模型（按天汇总，只在指标变化时写入）"""
+    __tablename__ = 'project_snapshots'
+    
+    # 复合主键 (project_id, snapshot_date)：同一项目的历史在聚簇索引中连续存放
+    project_id = db.Column(db.Integer, primary_key=True, autoincrement=False, comment='项目ID')
+    snapshot_date = db.Column(db.Date, primary_key=True, comment='快照日期')
+    stars_count = db.Column(db.Integer, default=0, comment='星标数量')
+    forks_count = db.Column(db.Integer, default=0, comment='分叉数量')
+    open_issues_count = db.Column(db.Integer, default=0, comment='开放问题数量')
+    updated_at = db.Column(db.TIMESTAMP, default=china_now, comment='当天最后一次写入时间')
+    
+    def __repr__(self):
+        return f'<ProjectSnapshot {self.project_id} {self.snapshot_date}>'
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'date': self.snapshot_date.isoformat(),
+            'stars_count': self.stars_count,
+            'forks_count': self.forks_count,
+            'open_issues_count': self.open_issues_count
+        }
+
+class RefreshChange(db.Model):
+    """刷新变更流水模型（每次刷新中新增、星标变化、归档、恢复的项目）"""
+    __tablename__ = 'refresh_changes'
+    
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    refresh_log_id = db.Column(db.Integer, nullable=False, comment='刷新日志ID')
+    project_id = db.Column(db.Integer, nullable=False, comment='项目ID')
+    change_type = db.Column(db.Enum('new', 'stars', 'archived', 'reactivated'), nullable=False, comment='变更类型')
+    stars_before = db.Column(db.Integer, comment='变更前星标数')
+    stars_after = db.Column(db.Integer, comment='变更后星标数')
+    stars_delta = db.Column(db.Integer, comment='星标变化量')
+    created_at = db.Column(db.TIMESTAMP, default=china_now)
+    
+    __table_args__ = (
+        # 按刷新分页（keyset: id > 上一页最后的id）
+        db.Index('idx_refresh_id', 'refresh_log_id', 'id'),
+        db.Index('idx_refresh_type', 'refresh_log_id', 'change_type', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<RefreshChange {self.refresh_log_id} {self.change_type}>'
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'change_type': self.change_type,
+            'stars_before': self.stars_before,
+            'stars_after': self.stars_after,
+            'stars_delta': self.stars_delta
+        }
 
 class SystemConfig(db.Model):
     """系统配置模型"""
@@ -149,6 +298,30 @@ class ApiStats(db.Model):
     def __repr__(self):
         return f'<ApiStats {self.date}>'
 
+class ApiTokenStats(db.Model):
+    """每个GitHub Token的API请求统计模型"""
+    __tablename__ = 'api_token_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, comment='日期')
+    token_key = db.Column(db.String(64), nullable=False, comment='Token标识(SHA256前缀)')
+    token_hint = db.Column(db.String(20), comment='Token掩码')
+    total_requests = db.Column(db.Integer, default=0, comment='总请求数')
+    successful_requests = db.Column(db.Integer, default=0, comment='成功请求数')
+    failed_requests = db.Column(db.Integer, default=0, comment='失败请求数')
+    rate_limit_hits = db.Column(db.Integer, default=0, comment='触发限制次数')
+    last_remaining = db.Column(db.Integer, comment='最近一次剩余额度')
+    last_reset_at = db.Column(db.Integer, comment='最近一次额度重置时间(Unix时间戳)')
+    created_at = db.Column(db.TIMESTAMP, default=china_now)
+    updated_at = db.Column(db.TIMESTAMP, default=china_now, onupdate=china_now)
+    
+    __table_args__ = (
+        db.UniqueConstraint('date', 'token_key', name='unique_date_token'),
+    )
+    
+    def __repr__(self):
+        return f'<ApiTokenStats {self.date} {self.token_hint}>'
+
 class SchedulerConfig(db.Model):
     """定时器配置模型"""
     __tablename__ = 'scheduler_config'
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from app import db
-from app.services import ProjectService, RefreshService, SchedulerService
+from app.services import ProjectService, RefreshService, SchedulerService, RefreshQueueFull, flush_api_stats
 from app.models import GitHubProject, RefreshLog, SchedulerConfig
 
 bp = Blueprint('main', __name__)
@@ -56,11 +56,10 @@ def manual_refresh():
     keyword = request.args.get('keyword', current_app.config['DEFAULT_SEARCH_KEYWORD'])
     
     try:
-        refresh_log = RefreshService.manual_refresh(keyword)
-        if refresh_log.status == 'success':
-            flash(f'刷新成功！新增 {refresh_log.new_projects} 个项目，更新 {refresh_log.updated_projects} 个项目', 'success')
-        else:
-            flash(f'刷新失败：{refresh_log.error_message}', 'error')
+        refresh_log = RefreshService.enqueue_refresh('manual', keyword)
+        flash(f'刷新任务已提交（#{refresh_log.id}），可在统计页面查看进度', 'success')
+    except RefreshQueueFull as e:
+        flash(str(e), 'warning')
     except Exception as e:
         flash(f'刷新过程中发生错误：{str(e)}', 'error')
     
@@ -75,7 +74,7 @@ def project_detail(project_id):
 @bp.route('/stats')
 def stats():
     """统计页面"""
-    from app.models import ApiStats
+    from app.models import ApiStats, ApiTokenStats
     from sqlalchemy import func
     
     # 项目统计
@@ -99,16 +98,25 @@ def stats():
         RefreshLog.created_at.desc()
     ).limit(10).all()
     
-    # API统计
+    # API统计（先写入缓冲中尚未落库的计数）
+    flush_api_stats()
     api_stats = ApiStats.query.order_by(ApiStats.date.desc()).limit(7).all()
     
+    # Token维度API统计（最近7天）
+    week_ago = api_stats[-1].date if api_stats else None
+    token_stats_query = ApiTokenStats.query
+    if week_ago:
+        token_stats_query = token_stats_query.filter(ApiTokenStats.date >= week_ago)
+    token_stats = token_stats_query.order_by(ApiTokenStats.date.desc(), ApiTokenStats.token_hint).all()
+    
     return render_template('stats.html',
                          total_projects=total_projects,
                          total_stars=total_stars,
                          total_forks=total_forks,
                          language_stats=language_stats,
                          recent_refreshes=recent_refreshes,
-                         api_stats=api_stats)
+                         api_stats=api_stats,
+                         token_stats=token_stats)
 
 @bp.route('/about')
 def about():
@@ -228,12 +236,10 @@ def execute_scheduler_config(config_id):
     """立即执行定时器配置"""
     try:
         refresh_log = SchedulerService.execute_config_now(config_id)
+        flash(f'任务已提交（#{refresh_log.id}），可在统计页面查看进度', 'success')
         
-        if refresh_log.status == 'success':
-            flash(f'任务执行成功！新增 {refresh_log.new_projects} 个项目，更新 {refresh_log.updated_projects} 个项目', 'success')
-        else:
-            flash(f'任务执行失败：{refresh_log.error_message}', 'error')
-        
+    except RefreshQueueFull as e:
+        flash(str(e), 'warning')
     except Exception as e:
         flash(f'执行任务失败：{str(e)}', 'error')
     
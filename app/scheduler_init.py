@@ -1,5 +1,5 @@
 from flask import current_app
-from app.services import SchedulerService
+from app.services import SchedulerService, RefreshService
 from datetime import datetime, timezone, timedelta
 
 # 中国时区 (UTC+8)
@@ -48,6 +48,15 @@ def init_scheduler(app):
     # 在应用上下文中执行设置
     with app.app_context():
         setup_scheduler()
+        
+        # 接管上次进程中断的刷新，从断点继续
+        if app.config.get('REFRESH_RESUME_ON_STARTUP', True):
+            try:
+                resumed = RefreshService.resume_orphaned_refreshes()
+                if resumed:
+                    app.logger.info(f"Resumed {len(resumed)} interrupted refreshes: {resumed}")
+            except Exception as e:
+                app.logger.error(f"Failed to resume interrupted refreshes: {str(e)}")
 
 def reload_all_schedules():
     """重新加载所有调度任务"""
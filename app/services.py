@@ -1,10 +1,33 @@
+import atexit
+import hashlib
+import json
+import math
+import os
+import queue
+import random
 import requests
+import socket
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
 from flask import current_app
 from app import db
-from app.models import GitHubProject, RefreshLog, SystemConfig, ApiStats, SchedulerConfig
-from sqlalchemy import and_, or_
+from app.models import (
+    GitHubProject, RefreshLog, RefreshLock, SystemConfig, ApiStats, ApiTokenStats, SchedulerConfig,
+    ProjectSnapshot, RefreshChange, SearchKeyword, ProjectKeyword
+)
+from sqlalchemy import and_, or_, func, tuple_, update, insert, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # 可选，安装后用于加速GitHub响应的JSON解析
+except ImportError:
+    orjson = None
 
 # 中国时区 (UTC+8)
 CHINA_TZ = timezone(timedelta(hours=8))
@@ -13,8 +36,9 @@ def china_now():
     """获取当前中国时间"""
     return datetime.now(CHINA_TZ).replace(tzinfo=None)
 
+@lru_cache(maxsize=65536)
 def utc_to_china(utc_time_str):
-    """将UTC时间字符串转换为中国时间"""
+    """将UTC时间字符串转换为中国时间（结果缓存，同一仓库在分片和多次刷新中会重复出现）"""
     if not utc_time_str:
         return None
     # 解析UTC时间
@@ -24,18 +48,922 @@ def utc_to_china(utc_time_str):
     # 移除时区信息，只保留时间
     return china_dt.replace(tzinfo=None)
 
+def json_loads(data):
+    """解析JSON（已安装orjson时使用orjson）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def china_to_utc_iso(china_dt):
+    """将中国时间（无时区信息）转换为GitHub搜索限定符使用的UTC时间字符串"""
+    utc_dt = china_dt.replace(tzinfo=CHINA_TZ).astimezone(timezone.utc)
+    return utc_dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def current_rss_mb():
+    """进程当前常驻内存(MB)，读取/proc（仅Linux），平台不支持时返回None"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+def wire_bytes(response):
+    """响应在网络上实际传输的字节数（gzip压缩后），无法获取时退回Content-Length或解压后的大小"""
+    content = response.content
+    try:
+        return int(response.raw.tell())
+    except (AttributeError, TypeError, ValueError):
+        pass
+    length = response.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else len(content)
+
+def split_keywords(keyword):
+    """拆分逗号分隔的关键词组（去除空白，忽略大小写去重，保持顺序）"""
+    keywords = []
+    seen = set()
+    for part in keyword.split(','):
+        part = ' '.join(part.split())
+        if part and part.lower() not in seen:
+            seen.add(part.lower())
+            keywords.append(part)
+    return keywords
+
+# 每个进程的启动标记，写入刷新锁的持有者标识，进程号被复用时也能区分新旧进程
+_process_tokens = {}
+
+def process_owner():
+    """当前进程的刷新锁持有者标识（主机:进程号:启动标记）"""
+    pid = os.getpid()
+    if pid not in _process_tokens:
+        _process_tokens[pid] = os.urandom(4).hex()
+    return f'{socket.gethostname()}:{pid}:{_process_tokens[pid]}'
+
+# 进程级共享的HTTP会话，所有刷新和定时任务复用同一个连接池
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """获取进程级共享的GitHub HTTP会话（首次调用时按当前配置创建）"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                _http_session = _create_http_session(current_app.config)
+    return _http_session
+
+def _create_http_session(config):
+    """创建带连接池、重试和压缩协商的HTTP会话"""
+    session = requests.Session()
+    
+    # 传输层只重试建立连接失败（如复用的长连接已被服务端关闭），
+    # 5xx和超时由GitHubService按退避策略重试并计入熔断器
+    retries = config.get('GITHUB_HTTP_MAX_RETRIES', 3)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=config.get('GITHUB_HTTP_BACKOFF_FACTOR', 0.5),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config.get('GITHUB_HTTP_POOL_CONNECTIONS', 4),
+        pool_maxsize=config.get('GITHUB_HTTP_POOL_MAXSIZE', 10),
+        max_retries=retry
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive' if config.get('GITHUB_HTTP_KEEP_ALIVE', True) else 'close'
+    })
+    return session
+
+class TokenBucket:
+    """令牌桶限速器（线程安全），根据响应中的限额信息自适应调整速率"""
+    
+    def __init__(self, rate_per_minute, burst):
+        self.max_rate = rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def acquire(self):
+        """获取一个令牌，不足时等待补充"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+    
+    def observe(self, headers):
+        """根据X-RateLimit-Remaining/Reset把剩余额度均匀分摊到重置前的时间窗口"""
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_time = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset_time is None:
+            return
+        try:
+            remaining = int(remaining)
+            seconds_left = max(int(reset_time) - time.time(), 1)
+        except ValueError:
+            return
+        if remaining <= 0:
+            # 额度耗尽由限额调度器负责推迟，令牌桶只负责平滑速率
+            return
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, max(remaining / seconds_left, 0.01))
+            self.tokens = min(self.tokens, remaining)
+
+class ResponseCache:
+    """GitHub搜索响应磁盘缓存，保存ETag/Last-Modified用于条件请求，按总大小做LRU淘汰"""
+    
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in self._entries())
+    
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.json')]
+    
+    def _path(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.json')
+    
+    def get(self, key):
+        """读取缓存条目，返回 {'etag', 'last_modified', 'body'} 或 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)  # 更新访问时间，供LRU淘汰使用
+            return entry
+        except (OSError, ValueError):
+            return None
+    
+    def set(self, key, etag, last_modified, body):
+        """写入缓存条目（先写临时文件再原子替换）"""
+        path = self._path(key)
+        data = json.dumps({'etag': etag, 'last_modified': last_modified, 'body': body}).encode('utf-8')
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            current_app.logger.warning(f"Failed to write response cache: {str(e)}")
+            return
+        
+        with self.lock:
+            self.total_bytes += len(data) - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+    
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小降到上限的90%"""
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.total_bytes -= size
+            except OSError:
+                continue
+
+# 进程级共享的搜索响应缓存
+_response_cache = None
+
+def get_response_cache():
+    """获取进程级共享的搜索响应缓存（未启用时返回None）"""
+    global _response_cache
+    if not current_app.config.get('GITHUB_CACHE_ENABLED', True):
+        return None
+    if _response_cache is None:
+        with _http_session_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    current_app.config['GITHUB_CACHE_DIR'],
+                    current_app.config.get('GITHUB_CACHE_MAX_MB', 200) * 1024 * 1024
+                )
+    return _response_cache
+
+class SessionRecorder:
+    """录制GitHub请求与响应，每个请求写入一个JSON文件，供本地模拟服务回放"""
+    
+    # 回放需要的响应头，其余丢弃
+    RECORDED_HEADERS = (
+        'Content-Type', 'ETag', 'Last-Modified', 'Link', 'Retry-After',
+        'X-RateLimit-Limit', 'X-RateLimit-Remaining', 'X-RateLimit-Reset',
+        'X-RateLimit-Used', 'X-RateLimit-Resource'
+    )
+    
+    def __init__(self, record_dir):
+        self.record_dir = record_dir
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.prefix = china_now().strftime('%Y%m%d%H%M%S')
+        os.makedirs(record_dir, exist_ok=True)
+    
+    def record(self, method, path, params, body, response):
+        """写入一条录制记录（path为相对API根地址的路径，不包含Authorization等请求头）"""
+        with self.lock:
+            self.sequence += 1
+            sequence = self.sequence
+        entry = {
+            'recorded_at': time.time(),
+            'request': {
+                'method': method,
+                'path': path,
+                'params': {key: str(value) for key, value in (params or {}).items()},
+                'body': body
+            },
+            'response': {
+                'status': response.status_code,
+                'headers': {
+                    name: response.headers[name] for name in self.RECORDED_HEADERS if name in response.headers
+                },
+                'body': response.text
+            }
+        }
+        path = os.path.join(self.record_dir, f'{self.prefix}_{sequence:06d}.json')
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+        except OSError as e:
+            current_app.logger.warning(f"Failed to record GitHub response: {str(e)}")
+
+_session_recorder = None
+
+def get_session_recorder():
+    """获取进程级共享的请求录制器（未配置GITHUB_RECORD_DIR时返回None）"""
+    global _session_recorder
+    record_dir = current_app.config.get('GITHUB_RECORD_DIR')
+    if not record_dir:
+        return None
+    if _session_recorder is None or _session_recorder.record_dir != record_dir:
+        with _http_session_lock:
+            if _session_recorder is None or _session_recorder.record_dir != record_dir:
+                _session_recorder = SessionRecorder(record_dir)
+    return _session_recorder
+
+class ApiStatsBuffer:
+    """进程内API请求计数缓冲：每次请求只累加内存计数，定期或刷新结束时
+    用一条 INSERT ... ON DUPLICATE KEY UPDATE 原子累加到 api_stats / api_token_stats"""
+    
+    COUNTERS = ('total_requests', 'successful_requests', 'failed_requests', 'rate_limit_hits')
+    
+    def __init__(self, flush_seconds=10, flush_requests=100):
+        self.flush_seconds = flush_seconds
+        self.flush_requests = flush_requests
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.daily = {}   # date -> 计数
+        self.tokens = {}  # (date, token_key) -> 计数及最近一次额度
+        self.pending = 0
+        self.last_flush = time.monotonic()
+    
+    def record(self, status_code, failed=False, credential=None):
+        """累加一次请求，返回是否达到刷写条件"""
+        today = china_now().date()
+        if failed or status_code >= 400:
+            counter = 'failed_requests'
+        else:
+            counter = 'successful_requests'
+        rate_limited = counter == 'failed_requests' and status_code in (403, 429)
+        
+        with self.lock:
+            rows = [self.daily.setdefault(today, dict.fromkeys(self.COUNTERS, 0))]
+            if credential:
+                token_row = self.tokens.setdefault((today, credential.key), dict.fromkeys(self.COUNTERS, 0))
+                token_row.update(
+                    token_hint=credential.hint,
+                    last_remaining=credential.remaining,
+                    last_reset_at=credential.reset_at or None
+                )
+                rows.append(token_row)
+            for row in rows:
+                row['total_requests'] += 1
+                row[counter] += 1
+                if rate_limited:
+                    row['rate_limit_hits'] += 1
+            self.pending += 1
+            return (self.pending >= self.flush_requests
+                    or time.monotonic() - self.last_flush >= self.flush_seconds)
+    
+    def flush(self):
+        """把缓冲的计数写入数据库（需在应用上下文中调用），失败时放回缓冲区，不丢失计数"""
+        with self.flush_lock:
+            with self.lock:
+                daily, tokens = self.daily, self.tokens
+                self.daily, self.tokens = {}, {}
+                self.pending = 0
+                self.last_flush = time.monotonic()
+            if not daily and not tokens:
+                return
+            
+            now = china_now()
+            try:
+                # 使用独立连接和事务，不影响调用方会话中未提交的数据
+                with db.engine.begin() as connection:
+                    if daily:
+                        connection.execute(self._upsert(ApiStats.__table__, [
+                            dict(counts, date=date, created_at=now, updated_at=now)
+                            for date, counts in daily.items()
+                        ]))
+                    if tokens:
+                        connection.execute(self._upsert(ApiTokenStats.__table__, [
+                            dict(counts, date=date, token_key=token_key, created_at=now, updated_at=now)
+                            for (date, token_key), counts in tokens.items()
+                        ], latest=('token_hint', 'last_remaining', 'last_reset_at')))
+            except Exception as e:
+                current_app.logger.error(f"Failed to flush API stats: {str(e)}")
+                self._merge(daily, tokens)
+    
+    def _upsert(self, table, rows, latest=()):
+        """计数列累加，latest中的列与updated_at取本次写入的值"""
+        stmt = mysql_insert(table).values(rows)
+        updates = {
+            name: func.coalesce(table.c[name], 0) + stmt.inserted[name]
+            for name in self.COUNTERS
+        }
+        for name in latest + ('updated_at',):
+            updates[name] = stmt.inserted[name]
+        return stmt.on_duplicate_key_update(updates)
+    
+    def _merge(self, daily, tokens):
+        """把写入失败的计数合并回缓冲区"""
+        with self.lock:
+            for target, source in ((self.daily, daily), (self.tokens, tokens)):
+                for key, counts in source.items():
+                    row = target.setdefault(key, dict.fromkeys(self.COUNTERS, 0))
+                    for name in self.COUNTERS:
+                        row[name] += counts[name]
+                    for name in ('token_hint', 'last_remaining', 'last_reset_at'):
+                        if name in counts:
+                            row.setdefault(name, counts[name])
+            self.pending += sum(counts['total_requests'] for counts in daily.values())
+
+_api_stats_buffer = None
+
+def get_api_stats_buffer():
+    """获取进程级共享的API计数缓冲，首次创建时注册退出时刷写"""
+    global _api_stats_buffer
+    if _api_stats_buffer is None:
+        with _http_session_lock:
+            if _api_stats_buffer is None:
+                _api_stats_buffer = ApiStatsBuffer(
+                    flush_seconds=current_app.config.get('API_STATS_FLUSH_SECONDS', 10),
+                    flush_requests=current_app.config.get('API_STATS_FLUSH_REQUESTS', 100)
+                )
+                atexit.register(_flush_api_stats_at_exit, current_app._get_current_object())
+    return _api_stats_buffer
+
+def flush_api_stats():
+    """立即把缓冲的API计数写入数据库（刷新结束、查看统计前调用）"""
+    if _api_stats_buffer is not None:
+        _api_stats_buffer.flush()
+
+def _flush_api_stats_at_exit(app):
+    """进程退出前写入剩余计数"""
+    with app.app_context():
+        flush_api_stats()
+
+class GitHubAPIError(Exception):
+    """GitHub API请求失败（retriable表示临时性错误，可稍后从失败的分页继续）"""
+    
+    def __init__(self, message, status_code=None, retriable=False, page=None):
+        self.message = message
+        self.status_code = status_code
+        self.retriable = retriable
+        self.page = page
+        super().__init__(message)
+    
+    def __str__(self):
+        if self.page:
+            return f"{self.message} (page {self.page})"
+        return self.message
+
+class CircuitOpenError(GitHubAPIError):
+    """GitHub服务持续异常，熔断器打开期间快速失败"""
+    
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(
+            f"GitHub API circuit open, retry after {int(retry_after)} seconds",
+            retriable=True
+        )
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却期内快速失败，冷却结束后放行一个试探请求"""
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+        # 状态变化（试探请求有结果）时唤醒等待的线程
+        self.changed = threading.Condition(self.lock)
+    
+    def before_request(self):
+        """请求前检查，熔断期间抛出CircuitOpenError"""
+        with self.lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open':
+                wait_time = self.opened_at + self.reset_timeout - time.monotonic()
+                if wait_time > 0:
+                    raise CircuitOpenError(wait_time)
+                self.state = 'half_open'
+                self.trial_in_flight = False
+            # 半开状态只放行一个试探请求
+            if self.trial_in_flight:
+                raise CircuitOpenError(1)
+            self.trial_in_flight = True
+    
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_in_flight = False
+            self.changed.notify_all()
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    current_app.logger.warning(f"GitHub API circuit opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            self.changed.notify_all()
+    
+    def retry_after(self):
+        """距离允许试探请求的剩余秒数，未熔断时为0；半开且试探请求未返回时按一个冷却周期估算"""
+        with self.lock:
+            if self.state == 'half_open' and self.trial_in_flight:
+                return self.reset_timeout
+            if self.state != 'open':
+                return 0
+            return max(0, self.opened_at + self.reset_timeout - time.monotonic())
+    
+    def wait_until_ready(self, timeout):
+        """等待熔断器允许发送请求：打开时等到冷却结束，半开时等到试探请求有结果。
+        在timeout秒内无法放行时返回False"""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                if self.state == 'closed':
+                    return True
+                if self.state == 'open':
+                    wait_time = self.opened_at + self.reset_timeout - now
+                    if wait_time <= 0:
+                        return True
+                    if now + wait_time > deadline:
+                        return False
+                elif not self.trial_in_flight:
+                    return True
+                else:
+                    wait_time = deadline - now
+                    if wait_time <= 0:
+                        return False
+                self.changed.wait(wait_time)
+
+# 进程级共享的熔断器
+_circuit_breaker = None
+
+def get_circuit_breaker():
+    """获取进程级共享的GitHub API熔断器"""
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        with _http_session_lock:
+            if _circuit_breaker is None:
+                _circuit_breaker = CircuitBreaker(
+                    current_app.config.get('GITHUB_CIRCUIT_FAILURE_THRESHOLD', 5),
+                    current_app.config.get('GITHUB_CIRCUIT_RESET_SECONDS', 30)
+                )
+    return _circuit_breaker
+
+class RateLimitDeferred(Exception):
+    """GitHub API额度不足，调用被推迟到额度重置之后"""
+    
+    def __init__(self, reset_at):
+        self.reset_at = reset_at
+        self.retry_after = max(0, int(reset_at - time.time()))
+        super().__init__(f"GitHub API rate limit exhausted, retry after {self.retry_after} seconds")
+
+class GitHubCredential:
+    """单个GitHub凭证（Token）的额度状态，每个凭证拥有独立的搜索令牌桶"""
+    
+    def __init__(self, token, rate_per_minute, burst):
+        self.token = token
+        if token:
+            self.key = hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+            self.hint = f'****{token[-4:]}'
+        else:
+            self.key = 'anonymous'
+            self.hint = 'anonymous'
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.limit = None
+        self.remaining = None
+        self.reset_at = 0
+        # 次级限流的解除时间，与主限额窗口（remaining/reset_at，只由X-RateLimit响应头维护）分开记录
+        self.blocked_until = 0
+    
+    def to_dict(self, reserve=0):
+        now = time.time()
+        return {
+            'token': self.hint,
+            'limit': self.limit,
+            'remaining': self.remaining,
+            'reset_at': int(self.reset_at) if self.reset_at else None,
+            'blocked_until': int(self.blocked_until) if self.blocked_until > now else None,
+            'parked': now < self.blocked_until
+                      or (self.remaining is not None and self.remaining <= reserve and now < self.reset_at)
+        }
+
+class RateLimitGovernor:
+    """进程级GitHub限额调度器：管理Token池，按剩余额度分配请求，额度耗尽的Token停放到重置时间"""
+    
+    def __init__(self, tokens, rate_per_minute=30, burst=10, reserve=0):
+        self.reserve = reserve
+        self.credentials = [GitHubCredential(token, rate_per_minute, burst) for token in (tokens or [None])]
+        self.lock = threading.Lock()
+    
+    def _is_parked(self, credential, now, reserved=0):
+        """凭证是否停放中（reserved为调用方已为本请求预扣的额度，判断时按预扣前的剩余额度计算）"""
+        if now < credential.blocked_until:
+            return True
+        if credential.reset_at and now >= credential.reset_at:
+            # 已过重置时间，额度未知，等待下一次响应更新
+            credential.remaining = None
+            return False
+        return credential.remaining is not None and credential.remaining + reserved <= self.reserve
+    
+    def _available_at(self, credential, now):
+        """停放的凭证恢复可用的时间：次级限流解除，且主限额耗尽时还需等到窗口重置"""
+        available_at = credential.blocked_until
+        if credential.remaining is not None and credential.remaining <= self.reserve and now < credential.reset_at:
+            available_at = max(available_at, credential.reset_at)
+        return available_at
+    
+    def acquire(self, max_wait=0):
+        """选择剩余额度最多的可用凭证，返回(凭证, 预扣的额度)；全部停放时短暂等待或抛出RateLimitDeferred"""
+        while True:
+            with self.lock:
+                now = time.time()
+                available = [c for c in self.credentials if not self._is_parked(c, now)]
+                if available:
+                    # 未知额度的凭证优先（尚未使用过）
+                    credential = max(
+                        available,
+                        key=lambda c: float('inf') if c.remaining is None else c.remaining
+                    )
+                    reserved = 0
+                    if credential.remaining is not None:
+                        # 预扣额度，使并发请求分散到不同凭证
+                        credential.remaining -= 1
+                        reserved = 1
+                    return credential, reserved
+                reset_at = min(self._available_at(c, now) for c in self.credentials)
+                wait_time = reset_at - now
+            
+            if wait_time > max_wait:
+                raise RateLimitDeferred(reset_at)
+            current_app.logger.info(f"GitHub API budget low, pacing for {wait_time:.1f} seconds")
+            time.sleep(max(wait_time, 0))
+    
+    def observe(self, credential, status_code, headers):
+        """根据响应头更新凭证的剩余额度"""
+        credential.bucket.observe(headers)
+        with self.lock:
+            try:
+                if headers.get('X-RateLimit-Limit') is not None:
+                    credential.limit = int(headers['X-RateLimit-Limit'])
+                remaining = headers.get('X-RateLimit-Remaining')
+                reset_at = headers.get('X-RateLimit-Reset')
+                if remaining is not None and reset_at is not None:
+                    remaining, reset_at = int(remaining), int(reset_at)
+                    if reset_at > credential.reset_at or credential.remaining is None:
+                        # 新的限额窗口
+                        credential.remaining = remaining
+                        credential.reset_at = reset_at
+                    elif reset_at == credential.reset_at:
+                        # 同一窗口内并发响应乱序到达，以最小剩余值为准
+                        credential.remaining = min(credential.remaining, remaining)
+            except ValueError:
+                pass
+            
+            # 次级限流只返回Retry-After，只停放到Retry-After到期，不影响主限额窗口
+            if status_code in (403, 429) and headers.get('Retry-After'):
+                try:
+                    credential.blocked_until = max(credential.blocked_until, time.time() + int(headers['Retry-After']))
+                except ValueError:
+                    pass
+    
+    def park(self, credential, seconds):
+        """停放凭证指定秒数（用于未携带Retry-After的次级限流）"""
+        with self.lock:
+            credential.blocked_until = max(credential.blocked_until, time.time() + seconds)
+    
+    def is_exhausted(self, credential, reserved=0):
+        """凭证当前是否已耗尽额度（reserved为本请求在acquire时预扣的额度，不计入耗尽判断）"""
+        with self.lock:
+            return self._is_parked(credential, time.time(), reserved)
+    
+    def budget(self):
+        """返回Token池整体及每个Token的额度信息"""
+        with self.lock:
+            now = time.time()
+            tokens = [c.to_dict(self.reserve) for c in self.credentials]
+            known = [c.remaining for c in self.credentials if c.remaining is not None]
+            parked = [c for c in self.credentials if self._is_parked(c, now)]
+            return {
+                'remaining': sum(known) if known else None,
+                'exhausted': len(parked) == len(self.credentials),
+                'reset_at': int(min(self._available_at(c, now) for c in parked)) if parked else None,
+                'tokens': tokens
+            }
+
+# 进程级共享的限额调度器（按API资源区分：search / graphql 各自独立计算额度）
+_rate_limit_governors = {}
+
+def get_rate_limit_governor(resource='search'):
+    """获取进程级共享的限额调度器（Token池）"""
+    if resource not in _rate_limit_governors:
+        with _http_session_lock:
+            if resource not in _rate_limit_governors:
+                config = current_app.config
+                tokens = list(config.get('GITHUB_TOKENS') or [])
+                if config.get('GITHUB_TOKEN') and config['GITHUB_TOKEN'] not in tokens:
+                    tokens.insert(0, config['GITHUB_TOKEN'])
+                prefix = 'GITHUB_GRAPHQL' if resource == 'graphql' else 'GITHUB_SEARCH'
+                _rate_limit_governors[resource] = RateLimitGovernor(
+                    tokens,
+                    rate_per_minute=config.get(f'{prefix}_RATE_PER_MINUTE', 30),
+                    burst=config.get(f'{prefix}_BURST', 10),
+                    reserve=config.get('GITHUB_RATE_LIMIT_RESERVE', 0)
+                )
+    return _rate_limit_governors[resource]
+
+# GraphQL批量回填只请求 ProjectService._update_project 写入的字段
+GRAPHQL_REPOSITORY_FIELDS = '''
+fragment RepoFields on Repository {
+    id
+    name
+    nameWithOwner
+    owner { login }
+    description
+    stargazerCount
+    forkCount
+    primaryLanguage { name }
+    repositoryTopics(first: 20) { nodes { topic { name } } }
+    licenseInfo { name }
+    updatedAt
+    pushedAt
+    diskUsage
+    issues(states: OPEN) { totalCount }
+    pullRequests(states: OPEN) { totalCount }
+    isArchived
+    isDisabled
+}
+'''
+
+def truncate_description(description):
+    """限制描述长度，避免数据库字段溢出"""
+    description = description or ''
+    if len(description) > 5000:  # 限制为5000字符
+        description = description[:4997] + '...'
+    return description
+
+class RepoRecord:
+    """刷新流程中的仓库记录：只保留GitHubProject存储的字段，时间已转换为中国时间"""
+    
+    __slots__ = (
+        'name', 'full_name', 'owner', 'description', 'html_url', 'node_id',
+        'stars_count', 'forks_count', 'watchers_count', 'language', 'topics', 'license_name',
+        'default_branch', 'is_private', 'is_fork', 'created_at', 'updated_at', 'pushed_at',
+        'size_kb', 'open_issues_count', 'has_issues', 'has_projects', 'has_wiki',
+        'archived', 'disabled', 'visibility'
+    )
+    
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+    
+    # 参与内容指纹的字段（即 ProjectService._update_project 更新的GitHub字段）
+    TRACKED_FIELDS = (
+        'description', 'stars_count', 'forks_count', 'watchers_count', 'language', 'topics',
+        'license_name', 'updated_at', 'pushed_at', 'size_kb', 'open_issues_count', 'archived', 'disabled'
+    )
+    
+    # 快照记录的指标字段
+    METRIC_FIELDS = ('stars_count', 'forks_count', 'open_issues_count')
+    
+    @property
+    def key(self):
+        """与unique_project一致的项目标识（MySQL默认排序规则不区分大小写）"""
+        return self.owner.lower(), self.name.lower()
+    
+    def fingerprint(self):
+        """跟踪字段的内容指纹，用于判断项目在GitHub上是否有变化"""
+        values = tuple(getattr(self, name) for name in self.TRACKED_FIELDS)
+        return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def from_rest(cls, item):
+        """从REST搜索结果条目构建"""
+        license_info = item.get('license')
+        return cls(
+            name=item['name'],
+            full_name=item['full_name'],
+            owner=item['owner']['login'],
+            description=truncate_description(item.get('description')),
+            html_url=item['html_url'],
+            node_id=item.get('node_id'),
+            stars_count=item.get('stargazers_count', 0),
+            forks_count=item.get('forks_count', 0),
+            watchers_count=item.get('watchers_count', 0),
+            language=item.get('language'),
+            topics=item.get('topics', [])[:20],  # 限制主题标签数量
+            license_name=license_info.get('name') if license_info else None,
+            default_branch=item.get('default_branch', 'main'),
+            is_private=item.get('private', False),
+            is_fork=item.get('fork', False),
+            created_at=utc_to_china(item.get('created_at')),
+            updated_at=utc_to_china(item.get('updated_at')),
+            pushed_at=utc_to_china(item.get('pushed_at')),
+            size_kb=item.get('size', 0),
+            open_issues_count=item.get('open_issues_count', 0),
+            has_issues=item.get('has_issues', True),
+            has_projects=item.get('has_projects', True),
+            has_wiki=item.get('has_wiki', True),
+            archived=item.get('archived', False),
+            disabled=item.get('disabled', False),
+            visibility=item.get('visibility', 'public')
+        )
+    
+    @classmethod
+    def from_graphql(cls, node):
+        """从GraphQL仓库节点构建（只包含ProjectService._update_project使用的字段）"""
+        return cls(
+            node_id=node['id'],
+            name=node['name'],
+            full_name=node['nameWithOwner'],
+            owner=node['owner']['login'],
+            description=truncate_description(node.get('description')),
+            stars_count=node.get('stargazerCount', 0),
+            forks_count=node.get('forkCount', 0),
+            # REST的watchers_count实际是星标数，GraphQL的watchers是订阅者数，保持列含义一致
+            watchers_count=node.get('stargazerCount', 0),
+            language=(node.get('primaryLanguage') or {}).get('name'),
+            topics=[item['topic']['name'] for item in (node.get('repositoryTopics') or {}).get('nodes', [])][:20],
+            license_name=node['licenseInfo']['name'] if node.get('licenseInfo') else None,
+            updated_at=utc_to_china(node.get('updatedAt')),
+            pushed_at=utc_to_china(node.get('pushedAt')),
+            size_kb=node.get('diskUsage') or 0,
+            # REST的open_issues_count包含开放的Pull Request
+            open_issues_count=(node.get('issues') or {}).get('totalCount', 0)
+                              + (node.get('pullRequests') or {}).get('totalCount', 0),
+            archived=node.get('isArchived', False),
+            disabled=node.get('isDisabled', False)
+        )
+
+def decode_search_page(body):
+    """解析搜索响应，条目直接转换为RepoRecord，不保留原始JSON"""
+    data = json_loads(body)
+    return {
+        'total_count': data.get('total_count', 0),
+        'incomplete_results': data.get('incomplete_results', False),
+        'items': [RepoRecord.from_rest(item) for item in data.get('items') or []]
+    }
+
+class SearchPage(list):
+    """一页搜索结果，附带来源查询和页码，写库后据此记录刷新断点
+    
+    批量刷新中keyword为抓取该页的关键词，refound为该页中已由其他关键词产出过的仓库 [(owner, name)]，
+    写库时据此逐批维护项目与关键词的对应关系。
+    """
+    
+    def __init__(self, items, query, page, last_page, keyword=None, refound=()):
+        super().__init__(items)
+        self.query = query
+        self.page = page
+        self.last_page = last_page
+        self.keyword = keyword
+        self.refound = refound
+    
+    def derive(self, items):
+        """用筛选后的结果构造同一来源的分页"""
+        return SearchPage(items, self.query, self.page, self.last_page, self.keyword, self.refound)
+
+class RefreshProgress:
+    """刷新进度与各阶段耗时统计（抓取线程与写库线程共享，由写库线程定期保存到刷新日志）
+    
+    阶段耗时为各线程累计值：fetch=HTTP请求，throttle=等待限流额度，parse=JSON解析，
+    upsert=项目写库，commit=事务提交，queue_wait=写库线程等待分页。
+    内存为本次刷新期间进程常驻内存相对开始时的最大增量（每页、每批采样；同一进程中并发的刷新会互相计入）。
+    """
+    
+    PHASES = ('fetch', 'throttle', 'parse', 'upsert', 'commit', 'queue_wait')
+    
+    def __init__(self, pages_fetched=0, metrics=None):
+        self.lock = threading.Lock()
+        # 从断点恢复时，已完成的页数同时计入已抓取和总数，耗时和请求数在上次的统计上累加
+        self.pages_fetched = pages_fetched
+        self.total_pages = pages_fetched
+        metrics = metrics or {}
+        self.phases = dict.fromkeys(self.PHASES, 0.0)
+        self.phases.update(metrics.get('phases', {}))
+        self.requests = metrics.get('requests', 0)
+        self.bytes_downloaded = metrics.get('bytes_downloaded', 0)
+        self.memory_growth = metrics.get('memory_growth_mb')
+        self.rss_start = current_rss_mb()
+    
+    def _sample_memory(self):
+        rss = current_rss_mb()
+        if rss is not None and self.rss_start is not None:
+            self.memory_growth = max(self.memory_growth or 0.0, rss - self.rss_start)
+    
+    def expect_pages(self, count):
+        with self.lock:
+            self.total_pages += count
+    
+    def page_fetched(self):
+        with self.lock:
+            self.pages_fetched += 1
+            self._sample_memory()
+    
+    def record(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] += seconds
+    
+    def request_done(self, seconds, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes_downloaded += size
+            self.phases['fetch'] += seconds
+    
+    def metrics(self, rows, elapsed):
+        """汇总为保存到刷新日志的统计（rows为已写库的项目数，elapsed为已运行秒数）"""
+        with self.lock:
+            self._sample_memory()
+            return {
+                'phases': {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+                'requests': self.requests,
+                'bytes_downloaded': self.bytes_downloaded,
+                'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else None,
+                'memory_growth_mb': round(self.memory_growth, 1) if self.memory_growth is not None else None
+            }
+
 class GitHubService:
     """GitHub API服务类"""
     
-    def __init__(self):
+    def __init__(self, max_wait=None, progress=None, checkpoint=None):
         self.base_url = current_app.config['GITHUB_API_BASE_URL']
-        self.token = current_app.config.get('GITHUB_TOKEN')
+        self.timeout = current_app.config.get('GITHUB_HTTP_TIMEOUT', 30)
+        self.session = get_http_session()
+        self.cache = get_response_cache()
+        self.recorder = get_session_recorder()
+        self.governor = get_rate_limit_governor()
+        self.breaker = get_circuit_breaker()
+        self.stats = get_api_stats_buffer()
+        self.max_retries = current_app.config.get('GITHUB_MAX_RETRIES', 3)
+        # 额度不足时允许在当前线程等待的最长时间，超过则推迟（Web请求应为0）
+        if max_wait is None:
+            max_wait = current_app.config.get('GITHUB_RATE_LIMIT_MAX_WAIT', 60)
+        self.max_wait = max_wait
+        self.fetch_workers = current_app.config.get('GITHUB_FETCH_WORKERS', 4)
+        self.progress = progress
+        # 刷新断点：plans为各查询的分片计划，pages为 {查询: [已写入的页码, 最后一页]}，恢复时跳过已完成的部分
+        self.checkpoint = checkpoint if checkpoint is not None else {'plans': {}, 'pages': {}}
         self.headers = {
             'Accept': 'application/vnd.github+json',
             'User-Agent': 'GitHub-News-App/1.0'
         }
-        if self.token:
-            self.headers['Authorization'] = f'token {self.token}'
     
     def search_repositories(self, keyword='AI', sort='stars', order='desc', per_page=100, page=1):
         """搜索仓库"""
@@ -48,211 +976,789 @@ class GitHubService:
             'page': page
         }
         
-        try:
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
-            self._update_api_stats(response.status_code)
-            
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code == 403:
-                # 处理API限制
-                reset_time = int(response.headers.get('X-RateLimit-Reset', 0))
-                wait_time = reset_time - int(time.time())
-                if wait_time > 0:
-                    current_app.logger.warning(f"API rate limit hit, waiting {wait_time} seconds")
-                    time.sleep(wait_time + 10)  # 额外等待10秒
-                return None
+        # 条件请求：携带上次的ETag/Last-Modified，304时复用缓存内容（不计入配额）
+        headers = dict(self.headers)
+        cache_key = [self.base_url, keyword, sort, order, per_page, page]
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._backoff(attempt)
+                current_app.logger.info(f"Retrying search (attempt {attempt + 1}): {error}")
+            
+            try:
+                response, credential = self._send(self.governor, 'GET', url, dict(headers), params=params)
+            except requests.RequestException as e:
+                error = GitHubAPIError(f"Request error: {str(e)}", retriable=True)
+                continue
+            
+            status_code = response.status_code
+            if status_code == 304 and cached:
+                return self._decode(cached['body'])
+            elif status_code == 200:
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if self.cache and (etag or last_modified):
+                    self.cache.set(cache_key, etag, last_modified, response.text)
+                return self._decode(response.content)
+            elif status_code in (403, 429) and self._is_rate_limited(response, credential):
+                # 当前Token被限流：停放该Token，换用其他Token重试，全部耗尽时推迟
+                current_app.logger.warning(f"API rate limit hit on token {credential.hint}")
+                return self.search_repositories(keyword, sort, order, per_page, page)
+            elif status_code >= 500 or status_code == 408:
+                error = GitHubAPIError(f"GitHub API error: {status_code}", status_code, retriable=True)
+                continue
             else:
-                current_app.logger.error(f"GitHub API error: {response.status_code}")
-                return None
-                
-        except Exception as e:
-            current_app.logger.error(f"Request error: {str(e)}")
-            self._update_api_stats(0, failed=True)
-            return None
+                # 其他4xx为请求本身的问题，重试无意义
+                current_app.logger.error(f"GitHub API error: {status_code}")
+                raise GitHubAPIError(f"GitHub API error: {status_code}", status_code)
+        
+        current_app.logger.error(f"GitHub API request failed after {self.max_retries} retries: {error}")
+        raise error
+    
+    @staticmethod
+    def _backoff(attempt):
+        """重试前等待：指数退避 + 全抖动，避免多个线程同时重试"""
+        delay = min(
+            current_app.config.get('GITHUB_RETRY_MAX_BACKOFF', 30),
+            current_app.config.get('GITHUB_RETRY_BACKOFF', 1) * 2 ** (attempt - 1)
+        )
+        time.sleep(random.uniform(0, delay))
+    
+    def _decode(self, body):
+        """解析搜索结果页，计入parse阶段耗时"""
+        parse_start = time.perf_counter()
+        result = decode_search_page(body)
+        if self.progress:
+            self.progress.record('parse', time.perf_counter() - parse_start)
+        return result
+    
+    def _is_rate_limited(self, response, credential):
+        """区分限流与其他403：主限额耗尽或次级限流时停放凭证"""
+        if self.governor.is_exhausted(credential):
+            return True
+        # 次级限流：带Retry-After（已在observe中停放），或仅在消息中说明
+        if response.headers.get('Retry-After'):
+            return True
+        if 'secondary rate limit' in response.text.lower():
+            self.governor.park(credential, current_app.config.get('GITHUB_SECONDARY_LIMIT_SECONDS', 60))
+            return True
+        return False
+    
+    def _send(self, governor, method, url, headers, require_token=False, **kwargs):
+        """从Token池中选择凭证发送请求，记录额度与统计，返回(response, credential)"""
+        # 令牌等待期间额度可能被其他线程耗尽，需重新选择凭证
+        wait_start = time.perf_counter()
+        while True:
+            credential, reserved = governor.acquire(self.max_wait)
+            credential.bucket.acquire()
+            # 按预扣前的剩余额度判断，窗口内最后一个单位的额度也能使用
+            if not governor.is_exhausted(credential, reserved):
+                break
+        if self.progress:
+            self.progress.record('throttle', time.perf_counter() - wait_start)
+        if credential.token:
+            headers['Authorization'] = f'token {credential.token}'
+        elif require_token:
+            raise ValueError('GitHub token is required for this API')
+        
+        self.breaker.before_request()
+        request_start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            self._update_api_stats(0, failed=True, credential=credential)
+            raise
+        if self.progress:
+            self.progress.request_done(time.perf_counter() - request_start, wire_bytes(response))
+        if response.status_code >= 500 or response.status_code == 408:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        governor.observe(credential, response.status_code, response.headers)
+        self._update_api_stats(response.status_code, credential=credential)
+        if self.recorder:
+            self.recorder.record(method, url[len(self.base_url):], kwargs.get('params'), kwargs.get('json'), response)
+        return response, credential
+    
+    def get_rate_limit_budget(self):
+        """获取当前进程内记录的GitHub API剩余额度"""
+        return self.governor.budget()
+    
+    @staticmethod
+    def dedupe_pages(pages, max_results):
+        """按full_name对逐页结果去重（翻页期间排名变化、分片重叠都会导致重复），达到上限后停止"""
+        seen = set()
+        for items in pages:
+            page = []
+            for repo in items:
+                if repo.full_name in seen:
+                    continue
+                seen.add(repo.full_name)
+                page.append(repo)
+                if len(seen) >= max_results:
+                    break
+            # 全部重复的分页也产出，使刷新断点随之推进
+            yield items.derive(page) if isinstance(items, SearchPage) else page
+            if len(seen) >= max_results:
+                return
     
-    def fetch_all_repositories(self, keyword='AI', max_results=1000):
-        """获取所有仓库（分页处理）"""
-        all_repos = []
-        page = 1
+    def iter_repository_pages(self, keyword='AI', max_results=1000, first_page=None, expect=True):
+        """逐页产出搜索结果：首页确定总数后并发获取剩余分页，按页序产出
+        （expect为False时不把页数计入进度总数，分片模式在规划后统一计入）。
+        断点中记录了该查询已写入的页码时，从下一页继续，不再请求首页。"""
         per_page = 100
+        app = current_app._get_current_object()
         
-        while len(all_repos) < max_results:
-            current_app.logger.info(f"Fetching page {page}")
-            result = self.search_repositories(
-                keyword=keyword, 
-                sort='stars', 
-                order='desc', 
-                per_page=per_page, 
-                page=page
-            )
-            
-            if not result or 'items' not in result:
-                break
-                
-            repos = result['items']
-            if not repos:
-                break
-                
-            all_repos.extend(repos)
+        def fetch_page(page):
+            with app.app_context():
+                app.logger.info(f"Fetching page {page}")
+                return self.search_repositories(
+                    keyword=keyword,
+                    sort='stars',
+                    order='desc',
+                    per_page=per_page,
+                    page=page
+                )
+        
+        resumed = self.checkpoint['pages'].get(keyword)
+        if resumed:
+            done_page, last_page = resumed
+            if self.progress and expect:
+                self.progress.expect_pages(max(0, last_page - done_page))
+            start_page = done_page + 1
+        else:
+            if first_page is None:
+                try:
+                    first_page = fetch_page(1)
+                except GitHubAPIError as e:
+                    first_page = self._resume_page(fetch_page, 1, e)
+            if not first_page.get('items'):
+                return
             
             # GitHub API最多返回1000个结果
-            if len(all_repos) >= result.get('total_count', 0) or page * per_page >= 1000:
+            total = min(first_page.get('total_count', 0), max_results, 1000)
+            last_page = max(1, math.ceil(total / per_page))
+            if self.progress:
+                if expect:
+                    self.progress.expect_pages(last_page)
+                self.progress.page_fetched()
+            yield SearchPage(first_page['items'], keyword, 1, last_page)
+            start_page = 2
+        if last_page < start_page:
+            return
+        
+        workers = max(1, min(self.fetch_workers, last_page - start_page + 1))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(fetch_page, page) for page in range(start_page, last_page + 1)]
+            for page, future in enumerate(futures, start=start_page):
+                try:
+                    result = future.result()
+                except GitHubAPIError as e:
+                    result = self._resume_page(fetch_page, page, e)
+                if self.progress:
+                    self.progress.page_fetched()
+                if not result.get('items'):
+                    current_app.logger.warning(f"Page {page} returned no data")
+                yield SearchPage(result.get('items') or [], keyword, page, last_page)
+        finally:
+            # 出现推迟等异常或调用方提前停止时取消尚未开始的分页请求
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _resume_page(self, fetch_page, page, error):
+        """分页在重试后仍失败时，等待熔断器冷却（及试探请求的结果）后从该分页继续，而不是中断整个刷新。
+        其他线程的试探请求尚未返回时被熔断拒绝不计入重试次数，总等待时间不超过max_wait×重试次数"""
+        attempts = current_app.config.get('GITHUB_PAGE_RESUME_ATTEMPTS', 2)
+        deadline = time.monotonic() + self.max_wait * max(1, attempts)
+        while attempts > 0 and error.retriable:
+            wait_time = self.breaker.retry_after()
+            current_app.logger.warning(f"Page {page} failed ({error.message}), resuming in up to {wait_time:.0f} seconds")
+            if not self.breaker.wait_until_ready(min(self.max_wait, max(0, deadline - time.monotonic()))):
                 break
-                
-            page += 1
-            time.sleep(1)  # 避免请求过快
+            try:
+                return fetch_page(page)
+            except CircuitOpenError as e:
+                # 与其他线程竞争试探请求失败，等待其结果后再试
+                error = e
+            except GitHubAPIError as e:
+                error = e
+                attempts -= 1
+        error.page = page
+        raise error
+    
+    def iter_sharded_repository_pages(self, keyword='AI', max_results=10000):
+        """分片模式下逐页产出搜索结果，多个分片并发抓取（从断点恢复时复用已保存的分片计划，不再重新探测）"""
+        plan = self.checkpoint['plans'].get(keyword)
+        if plan is not None:
+            shards = [dict(shard, first_page=None) for shard in plan]
+        else:
+            shards = self._plan_shards(keyword, max_results)
+            self.checkpoint['plans'][keyword] = [{'query': shard['query'], 'total': shard['total']} for shard in shards]
+        current_app.logger.info(
+            f"Sharded search for '{keyword}': {len(shards)} shards, "
+            f"{sum(shard['total'] for shard in shards)} results"
+        )
+        if not shards:
+            return
+        if self.progress:
+            shard_pages = sum(
+                math.ceil(min(shard['total'], 1000) / 100) - self.checkpoint['pages'].get(shard['query'], [0])[0]
+                for shard in shards
+            )
+            self.progress.expect_pages(max(0, min(shard_pages, math.ceil(max_results / 100))))
         
-        return all_repos[:max_results]
+        streams = [
+            partial(self.iter_repository_pages, shard['query'], shard['total'], shard['first_page'], expect=False)
+            for shard in shards
+        ]
+        yield from self._merge_streams(streams, current_app.config.get('GITHUB_SHARD_WORKERS', 2))
     
-    def _update_api_stats(self, status_code, failed=False):
-        """更新API统计"""
-        today = china_now().date()
-        stats = ApiStats.query.filter_by(date=today).first()
+    def iter_keyword_pages(self, query, max_results, written=0):
+        """逐页产出单个查询去重后的结果（超过单查询1000条上限时使用分片模式）；
+        written为从断点恢复前已写入的数量，计入结果上限（已达上限时返回空的生成器）"""
+        if max_results - written <= 0:
+            return (page for page in ())
+        if max_results > 1000 and current_app.config.get('GITHUB_SEARCH_SHARDING', True):
+            pages = self.iter_sharded_repository_pages(query, max_results)
+        else:
+            pages = self.iter_repository_pages(query, max_results)
+        return self.dedupe_pages(pages, max_results - written)
+    
+    def iter_keyword_set_pages(self, queries, max_results, keyword_stats):
+        """多个关键词并发抓取（共享同一限流额度），跨关键词按仓库去重后逐页产出，每个仓库只产出一次
         
-        if not stats:
-            stats = ApiStats(date=today)
-            db.session.add(stats)
+        queries为{关键词: 查询语句}；每个关键词的抓取数、首次发现数和只被该关键词找到的仓库数写入keyword_stats。
+        产出的分页带有抓取它的关键词，以及被去重掉的仓库（写库时补写它们与该关键词的对应关系）。
+        """
+        for keyword in queries:
+            keyword_stats[keyword] = {'fetched': 0, 'first_seen': 0, 'unique': 0}
+        found_by = {}
         
-        # 处理可能为None的统计字段
-        if stats.total_requests is None:
-            stats.total_requests = 0
-        stats.total_requests += 1
+        def tagged_pages(keyword, query):
+            for page in self.iter_keyword_pages(query, max_results):
+                yield keyword, page
         
-        if failed or status_code >= 400:
-            if stats.failed_requests is None:
-                stats.failed_requests = 0
-            stats.failed_requests += 1
-            if status_code == 403:
-                if stats.rate_limit_hits is None:
-                    stats.rate_limit_hits = 0
-                stats.rate_limit_hits += 1
-        else:
-            if stats.successful_requests is None:
-                stats.successful_requests = 0
-            stats.successful_requests += 1
+        streams = [partial(tagged_pages, keyword, query) for keyword, query in queries.items()]
+        for keyword, items in self._merge_streams(streams, current_app.config.get('BATCH_REFRESH_WORKERS', 3)):
+            stats = keyword_stats[keyword]
+            page = []
+            refound = []
+            for repo in items:
+                stats['fetched'] += 1
+                # 只保留仓库标识和关键词集合，不持有整个仓库记录
+                keywords = found_by.get(repo.key)
+                if keywords is None:
+                    keywords = found_by[repo.key] = set()
+                    stats['first_seen'] += 1
+                    page.append(repo)
+                elif keyword not in keywords:
+                    refound.append((repo.owner, repo.name))
+                keywords.add(keyword)
+            yield SearchPage(page, items.query, items.page, items.last_page, keyword, refound)
+        
+        for keywords in found_by.values():
+            if len(keywords) == 1:
+                keyword_stats[next(iter(keywords))]['unique'] += 1
+    
+    def _merge_streams(self, streams, workers):
+        """每个迭代器在独立线程中消费，按到达顺序合并产出（streams为返回迭代器的无参可调用对象）"""
+        app = current_app._get_current_object()
+        page_queue = queue.Queue(maxsize=current_app.config.get('REFRESH_QUEUE_SIZE', 4))
+        stop = threading.Event()
+        done = object()
         
+        def consume(stream):
+            with app.app_context():
+                try:
+                    for page in stream():
+                        if stop.is_set():
+                            return
+                        page_queue.put(page)
+                except BaseException as e:
+                    page_queue.put(e)
+                finally:
+                    page_queue.put(done)
+        
+        workers = max(1, min(workers, len(streams)))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(consume, stream) for stream in streams]
+        finished = 0
         try:
-            db.session.commit()
-        except Exception as e:
-            current_app.logger.error(f"Failed to update API stats: {str(e)}")
-            db.session.rollback()
+            while finished < len(futures):
+                item = page_queue.get()
+                if item is done:
+                    finished += 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            # 排空队列，直到已启动的消费线程全部退出（避免其阻塞在put上）
+            started = sum(1 for future in futures if not future.cancelled())
+            while finished < started:
+                if page_queue.get() is done:
+                    finished += 1
+    
+    def _probe(self, query):
+        """获取查询首页，用于判断分片大小（首页结果在抓取分片时复用）"""
+        result = self.search_repositories(keyword=query, sort='stars', order='desc', per_page=100, page=1)
+        return {'query': query, 'total': result.get('total_count', 0), 'first_page': result}
+    
+    def _plan_shards(self, keyword, max_results):
+        """递归拆分查询：先按星标范围（几何二分），单一星标值仍超限时再按创建日期二分"""
+        cap = 1000
+        root = self._probe(keyword)
+        if root['total'] <= cap:
+            return [root] if root['total'] else []
+        
+        top_stars = root['first_page']['items'][0].stars_count
+        max_depth = current_app.config.get('GITHUB_SHARD_MAX_DEPTH', 24)
+        shards = []
+        planned = [0]
+        
+        def split_created(lo_stars, hi_stars, start, end, depth):
+            stars = f"stars:{lo_stars}" if lo_stars == hi_stars else f"stars:{lo_stars}..{hi_stars}"
+            shard = self._probe(f"{keyword} {stars} created:{start.isoformat()}..{end.isoformat()}")
+            if not shard['total']:
+                return
+            if shard['total'] <= cap or start >= end or depth >= max_depth:
+                if shard['total'] > cap:
+                    current_app.logger.warning(f"Shard still exceeds search cap: {shard['query']}")
+                shards.append(shard)
+                planned[0] += min(shard['total'], cap)
+                return
+            mid = start + (end - start) / 2
+            # 新创建的仓库优先，与星标降序无关，顺序不影响去重
+            split_created(lo_stars, hi_stars, mid + timedelta(days=1), end, depth + 1)
+            if planned[0] < max_results:
+                split_created(lo_stars, hi_stars, start, mid, depth + 1)
+        
+        def split_stars(lo, hi, depth):
+            # hi为None表示开放上限，避免抓取期间新增星标导致遗漏
+            stars = f"stars:>={lo}" if hi is None else f"stars:{lo}..{hi}"
+            shard = self._probe(f"{keyword} {stars}")
+            if not shard['total']:
+                return
+            if shard['total'] <= cap or depth >= max_depth:
+                shards.append(shard)
+                planned[0] += min(shard['total'], cap)
+                return
+            upper = top_stars if hi is None else hi
+            if lo >= upper:
+                split_created(lo, lo, datetime(2008, 1, 1).date(), datetime.utcnow().date(), depth + 1)
+                return
+            # 星标分布长尾，按几何中点拆分，高星标区间优先
+            mid = max(lo, min(upper - 1, int(math.sqrt((lo + 1) * (upper + 1))) - 1))
+            split_stars(mid + 1, hi, depth + 1)
+            if planned[0] < max_results:
+                split_stars(lo, mid, depth + 1)
+        
+        split_stars(0, None, 0)
+        return shards
+    
+    def fetch_repositories_graphql(self, refs):
+        """通过GraphQL批量获取仓库（每次最多100个），refs为 [{'node_id', 'owner', 'name'}]，返回RepoRecord列表"""
+        node_ids = [ref['node_id'] for ref in refs if ref.get('node_id')]
+        by_name = [ref for ref in refs if not ref.get('node_id')]
+        
+        # 有node_id的用nodes批量查询，没有的按owner/name使用别名查询
+        parts = []
+        variables = {}
+        if node_ids:
+            parts.append('nodes(ids: $ids) { ... on Repository { ...RepoFields } }')
+            variables['ids'] = node_ids
+        for index, ref in enumerate(by_name):
+            parts.append(
+                f'r{index}: repository(owner: {json.dumps(ref["owner"])}, name: {json.dumps(ref["name"])}) '
+                '{ ...RepoFields }'
+            )
+        if not parts:
+            return []
+        
+        header = 'query($ids: [ID!]!)' if node_ids else 'query'
+        query = f"{header} {{ {' '.join(parts)} }}\n{GRAPHQL_REPOSITORY_FIELDS}"
+        
+        url = f"{self.base_url}/graphql"
+        headers = dict(self.headers)
+        governor = get_rate_limit_governor('graphql')
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._backoff(attempt)
+                current_app.logger.info(f"Retrying GraphQL request (attempt {attempt + 1}): {error}")
+            
+            try:
+                response, credential = self._send(
+                    governor, 'POST', url, dict(headers), require_token=True,
+                    json={'query': query, 'variables': variables}
+                )
+            except requests.RequestException as e:
+                error = GitHubAPIError(f"Request error: {str(e)}", retriable=True)
+                continue
+            
+            status_code = response.status_code
+            if status_code in (403, 429) and governor.is_exhausted(credential):
+                current_app.logger.warning(f"GraphQL rate limit hit on token {credential.hint}")
+                return self.fetch_repositories_graphql(refs)
+            elif status_code >= 500 or status_code == 408:
+                error = GitHubAPIError(f"GitHub GraphQL API error: {status_code}", status_code, retriable=True)
+                continue
+            elif status_code != 200:
+                raise GitHubAPIError(f"GitHub GraphQL API error: {status_code}", status_code)
+            break
+        else:
+            current_app.logger.error(f"GitHub GraphQL request failed after {self.max_retries} retries: {error}")
+            raise error
+        
+        result = json_loads(response.content)
+        data = result.get('data') or {}
+        if result.get('errors') and not data:
+            raise GitHubAPIError(f"GitHub GraphQL API error: {result['errors'][0].get('message')}")
+        
+        # 已删除或无权限访问的仓库返回null，直接跳过
+        nodes = list(data.get('nodes') or [])
+        nodes.extend(data.get(f'r{index}') for index in range(len(by_name)))
+        return [RepoRecord.from_graphql(node) for node in nodes if node]
+    
+    def _update_api_stats(self, status_code, failed=False, credential=None):
+        """更新API统计（含每个Token的使用量），计数先进入内存缓冲，按时间或数量批量写库"""
+        if self.stats.record(status_code, failed, credential):
+            self.stats.flush()
 
 class ProjectService:
     """项目管理服务类"""
     
     @staticmethod
-    def save_projects(repos_data, refresh_log_id=None):
-        """保存项目数据到数据库"""
-        new_count = 0
-        updated_count = 0
+    def save_projects(repos_data, refresh_log_id=None, keywords=None):
+        """保存项目数据到数据库：按块预加载已有项目，只对新增和有变化的项目执行
+        INSERT ... ON DUPLICATE KEY UPDATE，未变化的项目只批量更新抓取时间。
+        每块在保存点中写入，失败时二分重试，只跳过有问题的记录；每块单独提交，提交成功后才计入结果，
+        整块回滚时该块的全部记录计入失败。
+        refresh_log_id为所属刷新日志，指定时写入变更流水（刷新日志的计数由调用方累计）。
+        keywords为抓取到这些项目的关键词列表，指定时批量维护项目与关键词的对应关系。
+        返回 {'new', 'updated', 'unchanged', 'failed': [{'full_name', 'error'}], 'seconds': {'upsert', 'commit'}}"""
+        summary = {'new': 0, 'updated': 0, 'unchanged': 0, 'failed': [], 'seconds': {'upsert': 0.0, 'commit': 0.0}}
+        chunk_size = current_app.config.get('PROJECT_UPSERT_CHUNK_SIZE', 500)
+        touch_unchanged = current_app.config.get('PROJECT_TOUCH_UNCHANGED', True)
+        write_start = time.perf_counter()
+        keyword_ids = list(ProjectService.resolve_keyword_ids(keywords).values()) if keywords else []
+        
+        # 同一批次内的重复项目只保留最后一条
+        repos = list({repo.key: repo for repo in repos_data}.values())
         
-        for repo in repos_data:
+        for start in range(0, len(repos), chunk_size):
+            chunk = repos[start:start + chunk_size]
+            counts = {'new': 0, 'updated': 0, 'unchanged': 0, 'failed': []}
             try:
-                # 检查项目是否已存在
-                existing_project = GitHubProject.query.filter_by(
-                    name=repo['name'],
-                    owner=repo['owner']['login']
-                ).first()
+                # 一次IN查询取出本块已存在的项目，按内容指纹区分新增/有变化/未变化
+                existing = ProjectService.load_identity_index(chunk)
+                changed = []
+                unchanged_ids = []
+                for repo in chunk:
+                    identity = existing.get(repo.key)
+                    if identity is None or identity.content_hash != repo.fingerprint():
+                        changed.append(repo)
+                    else:
+                        unchanged_ids.append(identity.id)
                 
-                if existing_project:
-                    # 更新现有项目
-                    ProjectService._update_project(existing_project, repo)
-                    updated_count += 1
-                else:
-                    # 创建新项目
-                    ProjectService._create_project(repo)
-                    new_count += 1
+                written = ProjectService._write_isolated(changed, counts['failed'])
+                for repo in written:
+                    counts['updated' if repo.key in existing else 'new'] += 1
+                created = ProjectService._record_history(written, existing, refresh_log_id)
+                if unchanged_ids and touch_unchanged:
+                    with db.session.begin_nested():
+                        ProjectService._touch_projects(unchanged_ids)
+                counts['unchanged'] = len(unchanged_ids)
+                if keyword_ids:
+                    project_ids = unchanged_ids + [
+                        (existing.get(repo.key) or created[repo.key]).id
+                        for repo in written if repo.key in existing or repo.key in created
+                    ]
+                    ProjectService.link_keywords([
+                        (keyword_id, project_id) for keyword_id in keyword_ids for project_id in project_ids
+                    ])
                 
-                # 立即提交当前项目，避免会话回滚影响其他项目
-                db.session.flush()
-                    
+                commit_start = time.perf_counter()
+                summary['seconds']['upsert'] += commit_start - write_start
+                try:
+                    db.session.commit()
+                finally:
+                    write_start = time.perf_counter()
+                    summary['seconds']['commit'] += write_start - commit_start
             except Exception as e:
-                current_app.logger.error(f"Error saving project {repo.get('name', 'unknown')}: {str(e)}")
-                # 回滚当前事务，继续处理下一个项目
+                # 保存点无法回滚（如连接中断）或提交失败时，本块的写入全部撤销，整块计入失败
+                current_app.logger.error(f"Error saving {len(chunk)} projects: {str(e)}")
                 db.session.rollback()
+                summary['failed'].extend({'full_name': repo.full_name, 'error': str(e)[:500]} for repo in chunk)
+                write_start = time.perf_counter()
                 continue
+            
+            for name in ('new', 'updated', 'unchanged', 'failed'):
+                summary[name] += counts[name]
         
+        current_app.logger.info(
+            f"Saved {summary['new']} new projects, updated {summary['updated']} projects, "
+            f"{summary['unchanged']} unchanged, {len(summary['failed'])} failed"
+        )
+        return summary
+    
+    @staticmethod
+    def _write_isolated(repos, failed):
+        """在保存点中批量upsert，失败时二分重试，直到定位出单条出错的记录；返回写入成功的记录"""
+        if not repos:
+            return []
         try:
-            # 最终提交所有更改
-            db.session.commit()
-            current_app.logger.info(f"Saved {new_count} new projects, updated {updated_count} projects")
-            
-            # 更新刷新日志
-            if refresh_log_id:
-                refresh_log = RefreshLog.query.get(refresh_log_id)
-                if refresh_log:
-                    refresh_log.new_projects = new_count
-                    refresh_log.updated_projects = updated_count
-                    refresh_log.total_fetched = len(repos_data)
-                    db.session.commit()
-                    
+            with db.session.begin_nested():
+                db.session.execute(ProjectService._upsert_statement(repos))
+            return repos
         except Exception as e:
-            current_app.logger.error(f"Error committing projects: {str(e)}")
-            db.session.rollback()
-            
-        return new_count, updated_count
-    
-    @staticmethod
-    def _create_project(repo):
-        """创建新项目"""
-        # 限制描述长度，避免数据库字段溢出
-        description = repo.get('description', '') or ''
-        if len(description) > 5000:  # 限制为5000字符
-            description = description[:4997] + '...'
-        
-        project = GitHubProject(
-            name=repo['name'],
-            full_name=repo['full_name'],
-            owner=repo['owner']['login'],
-            description=description,
-            html_url=repo['html_url'],
-            stars_count=repo.get('stargazers_count', 0),
-            forks_count=repo.get('forks_count', 0),
-            watchers_count=repo.get('watchers_count', 0),
-            language=repo.get('language'),
-            topics=repo.get('topics', [])[:20],  # 限制主题标签数量
-            license_name=repo.get('license', {}).get('name') if repo.get('license') else None,
-            default_branch=repo.get('default_branch', 'main'),
-            is_private=repo.get('private', False),
-            is_fork=repo.get('fork', False),
-            created_at=utc_to_china(repo.get('created_at')),
-            updated_at=utc_to_china(repo.get('updated_at')),
-            pushed_at=utc_to_china(repo.get('pushed_at')),
-            size_kb=repo.get('size', 0),
-            open_issues_count=repo.get('open_issues_count', 0),
-            has_issues=repo.get('has_issues', True),
-            has_projects=repo.get('has_projects', True),
-            has_wiki=repo.get('has_wiki', True),
-            archived=repo.get('archived', False),
-            disabled=repo.get('disabled', False),
-            visibility=repo.get('visibility', 'public')
+            if len(repos) == 1:
+                # 只保留数据库驱动的原始错误，不包含整条SQL
+                message = str(getattr(e, 'orig', None) or e)[:500]
+                current_app.logger.warning(f"Error saving project {repos[0].full_name}: {message}")
+                failed.append({'full_name': repos[0].full_name, 'error': message})
+                return []
+        middle = len(repos) // 2
+        return (ProjectService._write_isolated(repos[:middle], failed)
+                + ProjectService._write_isolated(repos[middle:], failed))
+    
+    @staticmethod
+    def _touch_projects(project_ids):
+        """未变化的项目只记录本次抓取，local_updated_at保持原值（同时阻止MySQL的ON UPDATE CURRENT_TIMESTAMP）"""
+        db.session.execute(
+            update(GitHubProject.__table__).where(
+                GitHubProject.__table__.c.id.in_(project_ids)
+            ).values(
+                last_fetched_at=china_now(),
+                fetch_count=func.coalesce(GitHubProject.__table__.c.fetch_count, 0) + 1,
+                local_updated_at=GitHubProject.__table__.c.local_updated_at
+            )
         )
-        db.session.add(project)
+    
+    @staticmethod
+    def load_identity_index(repos):
+        """按 (owner, name) 一次查询已存在的项目，返回 {(owner, name)小写: 行(id, content_hash及指标字段)}"""
+        if not repos:
+            return {}
+        rows = db.session.query(
+            GitHubProject.id, GitHubProject.owner, GitHubProject.name, GitHubProject.content_hash,
+            GitHubProject.stars_count, GitHubProject.forks_count, GitHubProject.open_issues_count,
+            GitHubProject.archived
+        ).filter(
+            # 列顺序与unique_project索引 (name, owner) 一致
+            tuple_(GitHubProject.name, GitHubProject.owner).in_([(repo.name, repo.owner) for repo in repos])
+        ).all()
+        return {(row.owner.lower(), row.name.lower()): row for row in rows}
+    
+    @staticmethod
+    def _record_history(repos, existing, refresh_log_id=None):
+        """为写入的项目记录历史：新增和指标有变化的写当天快照，指定刷新日志时写变更流水；
+        返回新增项目的身份索引（与load_identity_index格式相同）"""
+        snapshots = []
+        changes = []
+        new_repos = []
+        created = {}
+        for repo in repos:
+            identity = existing.get(repo.key)
+            if identity is None:
+                new_repos.append(repo)
+                continue
+            if any(getattr(identity, name) != getattr(repo, name) for name in RepoRecord.METRIC_FIELDS):
+                snapshots.append((identity.id, repo))
+            if identity.stars_count != repo.stars_count:
+                changes.append(dict(
+                    project_id=identity.id, change_type='stars',
+                    stars_before=identity.stars_count, stars_after=repo.stars_count,
+                    stars_delta=repo.stars_count - (identity.stars_count or 0)
+                ))
+            if bool(identity.archived) != bool(repo.archived):
+                changes.append(dict(
+                    project_id=identity.id, change_type='archived' if repo.archived else 'reactivated',
+                    stars_before=identity.stars_count, stars_after=repo.stars_count
+                ))
+        if new_repos:
+            # 新项目的ID需在写入后再查一次
+            created = ProjectService.load_identity_index(new_repos)
+            for repo in new_repos:
+                if repo.key in created:
+                    snapshots.append((created[repo.key].id, repo))
+                    changes.append(dict(
+                        project_id=created[repo.key].id, change_type='new',
+                        stars_after=repo.stars_count, stars_delta=repo.stars_count
+                    ))
+        
+        try:
+            with db.session.begin_nested():
+                ProjectService.write_snapshots(
+                    [dict(project_id=project_id, **{name: getattr(repo, name) for name in RepoRecord.METRIC_FIELDS})
+                     for project_id, repo in snapshots]
+                )
+                if refresh_log_id and changes:
+                    now = china_now()
+                    # 多行INSERT要求每行的列一致，缺省的星标字段补None
+                    db.session.execute(insert(RefreshChange.__table__).values([
+                        dict(
+                            dict.fromkeys(('stars_before', 'stars_after', 'stars_delta')),
+                            refresh_log_id=refresh_log_id, created_at=now, **change
+                        ) for change in changes
+                    ]))
+        except Exception as e:
+            # 历史记录写入失败不影响项目数据
+            current_app.logger.error(f"Error writing project history: {str(getattr(e, 'orig', None) or e)}")
+        return created
+    
+    @staticmethod
+    def resolve_keyword_ids(keywords):
+        """返回 {规范化后的关键词: ID}，不存在的关键词先批量插入"""
+        normalized = list(dict.fromkeys(SearchKeyword.normalize(keyword) for keyword in keywords))
+        stmt = mysql_insert(SearchKeyword.__table__).values([
+            dict(keyword=keyword, created_at=china_now()) for keyword in normalized
+        ])
+        # 已存在时不做修改，仅为避免唯一键冲突
+        db.session.execute(stmt.on_duplicate_key_update(keyword=stmt.inserted.keyword))
+        rows = db.session.query(SearchKeyword.id, SearchKeyword.keyword).filter(SearchKeyword.keyword.in_(normalized))
+        return {row.keyword: row.id for row in rows}
+    
+    @staticmethod
+    def link_keywords(pairs):
+        """批量写入项目与关键词的对应关系，pairs为 [(keyword_id, project_id)]；已存在的只更新last_seen_at"""
+        if not pairs:
+            return
+        now = china_now()
+        try:
+            with db.session.begin_nested():
+                stmt = mysql_insert(ProjectKeyword.__table__).values([
+                    dict(keyword_id=keyword_id, project_id=project_id, first_seen_at=now, last_seen_at=now)
+                    for keyword_id, project_id in pairs
+                ])
+                db.session.execute(stmt.on_duplicate_key_update(last_seen_at=stmt.inserted.last_seen_at))
+        except Exception as e:
+            # 关键词关系写入失败不影响项目数据
+            current_app.logger.error(f"Error linking project keywords: {str(getattr(e, 'orig', None) or e)}")
+    
+    @staticmethod
+    def link_keyword_memberships(memberships):
+        """写入已存在项目与关键词的对应关系，memberships为 [((owner, name), 关键词集合)]；尚未写入的项目跳过"""
+        if not memberships:
+            return
+        chunk_size = current_app.config.get('PROJECT_UPSERT_CHUNK_SIZE', 500)
+        keyword_ids = ProjectService.resolve_keyword_ids(set().union(*(keywords for _, keywords in memberships)))
+        for start in range(0, len(memberships), chunk_size):
+            chunk = memberships[start:start + chunk_size]
+            rows = db.session.query(GitHubProject.id, GitHubProject.owner, GitHubProject.name).filter(
+                tuple_(GitHubProject.name, GitHubProject.owner).in_([(name, owner) for (owner, name), _ in chunk])
+            )
+            project_ids = {(row.owner.lower(), row.name.lower()): row.id for row in rows}
+            ProjectService.link_keywords([
+                (keyword_ids[SearchKeyword.normalize(keyword)], project_ids[(owner.lower(), name.lower())])
+                for (owner, name), keywords in chunk if (owner.lower(), name.lower()) in project_ids
+                for keyword in keywords
+            ])
+            db.session.commit()
+    
+    @staticmethod
+    def write_snapshots(rows):
+        """批量写入当天快照，rows为 [{'project_id', 'stars_count', 'forks_count', 'open_issues_count'}]；
+        同一天多次刷新只保留最后的值"""
+        if not rows:
+            return
+        now = china_now()
+        stmt = mysql_insert(ProjectSnapshot.__table__).values([
+            dict(row, snapshot_date=now.date(), updated_at=now) for row in rows
+        ])
+        db.session.execute(stmt.on_duplicate_key_update({
+            name: stmt.inserted[name] for name in RepoRecord.METRIC_FIELDS + ('updated_at',)
+        }))
+    
+    @staticmethod
+    def get_star_history(project_id, days=None):
+        """获取项目的指标快照序列（按日期升序，只包含有变化的日期）"""
+        query = ProjectSnapshot.query.filter(ProjectSnapshot.project_id == project_id)
+        if days:
+            query = query.filter(ProjectSnapshot.snapshot_date >= china_now().date() - timedelta(days=days))
+        return query.order_by(ProjectSnapshot.snapshot_date).all()
+    
+    @staticmethod
+    def _upsert_statement(repos):
+        """构建多行upsert语句：新项目插入全部字段，已存在的项目按 _update_project 的字段更新"""
+        table = GitHubProject.__table__
+        now = china_now()
+        rows = [{
+            'name': repo.name,
+            'full_name': repo.full_name,
+            'owner': repo.owner,
+            'description': repo.description,
+            'html_url': repo.html_url,
+            'node_id': repo.node_id,
+            'stars_count': repo.stars_count,
+            'forks_count': repo.forks_count,
+            'watchers_count': repo.watchers_count,
+            'language': repo.language,
+            'topics': repo.topics,
+            'license_name': repo.license_name,
+            'default_branch': repo.default_branch,
+            'is_private': repo.is_private,
+            'is_fork': repo.is_fork,
+            'created_at': repo.created_at,
+            'updated_at': repo.updated_at,
+            'pushed_at': repo.pushed_at,
+            'size_kb': repo.size_kb,
+            'open_issues_count': repo.open_issues_count,
+            'has_issues': repo.has_issues,
+            'has_projects': repo.has_projects,
+            'has_wiki': repo.has_wiki,
+            'archived': repo.archived,
+            'disabled': repo.disabled,
+            'visibility': repo.visibility,
+            'local_created_at': now,
+            'local_updated_at': now,
+            'last_fetched_at': now,
+            'fetch_count': 1,
+            'content_hash': repo.fingerprint()
+        } for repo in repos]
+        
+        stmt = mysql_insert(table).values(rows)
+        updates = {name: stmt.inserted[name] for name in (
+            'description', 'stars_count', 'forks_count', 'watchers_count', 'language', 'topics',
+            'license_name', 'updated_at', 'pushed_at', 'size_kb', 'open_issues_count',
+            'archived', 'disabled', 'last_fetched_at', 'content_hash',
+            # ODKU不会触发ORM的onupdate，需要显式更新
+            'local_updated_at'
+        )}
+        updates['node_id'] = func.coalesce(stmt.inserted.node_id, table.c.node_id)
+        updates['fetch_count'] = func.coalesce(table.c.fetch_count, 0) + 1
+        return stmt.on_duplicate_key_update(updates)
     
     @staticmethod
     def _update_project(project, repo):
         """更新现有项目"""
-        # 限制描述长度，避免数据库字段溢出
-        description = repo.get('description', '') or ''
-        if len(description) > 5000:  # 限制为5000字符
-            description = description[:4997] + '...'
-        
-        # 更新项目信息
-        project.description = description
-        project.stars_count = repo.get('stargazers_count', 0)
-        project.forks_count = repo.get('forks_count', 0)
-        project.watchers_count = repo.get('watchers_count', 0)
-        project.language = repo.get('language')
-        project.topics = repo.get('topics', [])[:20]  # 限制主题标签数量
-        project.license_name = repo.get('license', {}).get('name') if repo.get('license') else None
-        project.updated_at = utc_to_china(repo.get('updated_at'))
-        project.pushed_at = utc_to_china(repo.get('pushed_at'))
-        project.size_kb = repo.get('size', 0)
-        project.open_issues_count = repo.get('open_issues_count', 0)
-        project.archived = repo.get('archived', False)
-        project.disabled = repo.get('disabled', False)
+        project.description = repo.description
+        project.stars_count = repo.stars_count
+        project.forks_count = repo.forks_count
+        project.watchers_count = repo.watchers_count
+        project.language = repo.language
+        project.topics = repo.topics
+        project.license_name = repo.license_name
+        project.updated_at = repo.updated_at
+        project.pushed_at = repo.pushed_at
+        project.size_kb = repo.size_kb
+        project.open_issues_count = repo.open_issues_count
+        project.archived = repo.archived
+        project.disabled = repo.disabled
         project.last_fetched_at = china_now()
+        project.content_hash = repo.fingerprint()
+        if repo.node_id:
+            project.node_id = repo.node_id
         
         # 处理fetch_count可能为None的情况
         if project.fetch_count is None:
@@ -261,10 +1767,104 @@ class ProjectService:
             project.fetch_count += 1
     
     @staticmethod
-    def search_projects(keyword=None, owner=None, language=None, sort_by='stars_count', order='desc', page=1, per_page=20):
-        """搜索项目"""
+    def rehydrate_projects(batch_size=100, limit=None):
+        """通过GraphQL批量回填已跟踪项目的星标、分叉等数据，不依赖项目重新出现在搜索结果中
+        
+        与刷新写库相同，只更新内容指纹有变化的项目，未变化的项目只批量更新抓取时间。
+        """
+        github_service = GitHubService()
+        batch_size = min(batch_size, 100)
+        touch_unchanged = current_app.config.get('PROJECT_TOUCH_UNCHANGED', True)
+        summary = {'requested': 0, 'updated': 0, 'unchanged': 0, 'missing': 0, 'requests': 0}
+        last_id = 0
+        
+        while limit is None or summary['requested'] < limit:
+            size = batch_size if limit is None else min(batch_size, limit - summary['requested'])
+            # 按主键分批遍历，避免大偏移量分页
+            projects = GitHubProject.query.filter(GitHubProject.id > last_id).order_by(
+                GitHubProject.id
+            ).limit(size).all()
+            if not projects:
+                break
+            last_id = projects[-1].id
+            
+            refs = [{'node_id': p.node_id, 'owner': p.owner, 'name': p.name} for p in projects]
+            repos = github_service.fetch_repositories_graphql(refs)
+            summary['requests'] += 1
+            summary['requested'] += len(projects)
+            
+            by_node_id = {p.node_id: p for p in projects if p.node_id}
+            by_name = {(p.owner, p.name): p for p in projects}
+            snapshots = []
+            unchanged_ids = []
+            updated = 0
+            for repo in repos:
+                project = by_node_id.get(repo.node_id) or by_name.get((repo.owner, repo.name))
+                if not project:
+                    continue
+                if project.content_hash == repo.fingerprint() and (not repo.node_id or project.node_id == repo.node_id):
+                    unchanged_ids.append(project.id)
+                    continue
+                if any(getattr(project, name) != getattr(repo, name) for name in RepoRecord.METRIC_FIELDS):
+                    snapshots.append(dict(
+                        project_id=project.id,
+                        **{name: getattr(repo, name) for name in RepoRecord.METRIC_FIELDS}
+                    ))
+                ProjectService._update_project(project, repo)
+                updated += 1
+            summary['missing'] += len(projects) - len(repos)
+            
+            try:
+                ProjectService.write_snapshots(snapshots)
+                if unchanged_ids and touch_unchanged:
+                    ProjectService._touch_projects(unchanged_ids)
+                db.session.commit()
+            except Exception as e:
+                current_app.logger.error(f"Error committing rehydrated projects: {str(e)}")
+                db.session.rollback()
+                continue
+            summary['updated'] += updated
+            summary['unchanged'] += len(unchanged_ids)
+        
+        flush_api_stats()
+        current_app.logger.info(
+            f"Rehydrated {summary['updated']} projects ({summary['unchanged']} unchanged) "
+            f"with {summary['requests']} GraphQL requests"
+        )
+        return summary
+    
+    @staticmethod
+    def enqueue_rehydrate(limit=None):
+        """提交GraphQL回填后台任务（与刷新共用有界任务队列，队列已满时抛出RefreshQueueFull）"""
+        app = current_app._get_current_object()
+        
+        def rehydrate_job():
+            with app.app_context():
+                try:
+                    summary = ProjectService.rehydrate_projects(limit=limit)
+                    app.logger.info(f"Rehydrate job completed: {summary}")
+                except Exception as e:
+                    app.logger.error(f"Rehydrate job failed: {str(e)}")
+                finally:
+                    db.session.remove()
+        
+        get_refresh_executor().submit(rehydrate_job)
+    
+    @staticmethod
+    def search_projects(keyword=None, owner=None, language=None, sort_by='stars_count', order='desc', page=1, per_page=20,
+                        keyword_set=None):
+        """搜索项目（keyword_set为逗号分隔的搜索关键词，只返回被其中任一关键词的刷新抓取到的项目）"""
         query = GitHubProject.query
         
+        if keyword_set:
+            # 经project_keywords主键 (keyword_id, project_id) 解析，不扫描项目表的名称和描述
+            normalized = [SearchKeyword.normalize(item) for item in split_keywords(keyword_set)]
+            query = query.filter(GitHubProject.id.in_(
+                db.select(ProjectKeyword.project_id)
+                .join(SearchKeyword, SearchKeyword.id == ProjectKeyword.keyword_id)
+                .where(SearchKeyword.keyword.in_(normalized))
+            ))
+        
         # 构建搜索条件
         if keyword:
             query = query.filter(
@@ -307,62 +1907,385 @@ class ProjectService:
         
         return pagination
 
+class RefreshQueueFull(Exception):
+    """后台刷新任务队列已满"""
+
+class RefreshJobExecutor:
+    """有界的后台刷新任务执行器：同时运行workers个任务，最多再排队queue_size个"""
+    
+    def __init__(self, workers, queue_size):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='refresh-job')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+    
+    def submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise RefreshQueueFull('刷新任务队列已满，请稍后再试')
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+_refresh_executor = None
+
+def get_refresh_executor():
+    """获取进程级共享的后台刷新任务执行器"""
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _http_session_lock:
+            if _refresh_executor is None:
+                _refresh_executor = RefreshJobExecutor(
+                    workers=current_app.config.get('REFRESH_JOB_WORKERS', 2),
+                    queue_size=current_app.config.get('REFRESH_JOB_QUEUE_SIZE', 8)
+                )
+    return _refresh_executor
+
+class RefreshLockHeartbeat(threading.Thread):
+    """定期续期刷新锁租约的后台线程：分片规划、等待额度等长时间不写库的阶段锁也不会过期"""
+    
+    def __init__(self, app, keyword, refresh_log_id):
+        super().__init__(name=f'refresh-lock-{refresh_log_id}', daemon=True)
+        self.app = app
+        self.keyword = keyword
+        self.refresh_log_id = refresh_log_id
+        self.stopped = threading.Event()
+    
+    def run(self):
+        with self.app.app_context():
+            interval = max(1, self.app.config.get('REFRESH_LOCK_LEASE_SECONDS', 900) / 3)
+            try:
+                while not self.stopped.wait(interval):
+                    try:
+                        if not RefreshService._renew_refresh_lock(self.keyword, self.refresh_log_id):
+                            self.app.logger.warning(
+                                f"Refresh lock for '{self.keyword}' is no longer held by refresh {self.refresh_log_id}"
+                            )
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        self.app.logger.error(f"Failed to renew refresh lock for '{self.keyword}': {str(e)}")
+            finally:
+                db.session.remove()
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
 class RefreshService:
     """刷新服务类"""
     
     @staticmethod
-    def manual_refresh(keyword=None):
-        """手动刷新"""
+    def enqueue_refresh(refresh_type='manual', keyword=None, max_results=None, mode=None):
+        """提交后台刷新任务，立即返回状态为queued的刷新日志（队列已满时抛出RefreshQueueFull）"""
+        if not keyword:
+            keyword = current_app.config['DEFAULT_SEARCH_KEYWORD']
+        keyword = ','.join(split_keywords(keyword))
+        
+        refresh_log = RefreshLog(
+            refresh_type=refresh_type,
+            keyword=keyword,
+            start_time=china_now(),
+            status='queued',
+            # 保存提交参数，进程在任务开始前重启时按原参数执行
+            checkpoint={'max_results': max_results, 'mode': mode}
+        )
+        db.session.add(refresh_log)
+        db.session.commit()
+        
+        # 同一关键词已有排队或运行中的刷新时直接返回它，不重复抓取
+        holder_id = RefreshService._acquire_refresh_lock(keyword, refresh_log.id)
+        if holder_id:
+            db.session.delete(refresh_log)
+            db.session.commit()
+            current_app.logger.info(f"Refresh for keyword '{keyword}' already in flight as {holder_id}")
+            return db.session.get(RefreshLog, holder_id)
+        
+        app = current_app._get_current_object()
+        try:
+            get_refresh_executor().submit(RefreshService._run_job, app, refresh_log.id, max_results, mode)
+        except RefreshQueueFull as e:
+            refresh_log.status = 'failed'
+            refresh_log.end_time = china_now()
+            refresh_log.error_message = str(e)
+            db.session.commit()
+            RefreshService._release_refresh_lock(keyword, refresh_log.id)
+            raise
+        
+        current_app.logger.info(f"Refresh job {refresh_log.id} queued for keyword '{keyword}'")
+        return refresh_log
+    
+    @staticmethod
+    def _run_job(app, refresh_log_id, max_results, mode):
+        """后台线程中执行已排队的刷新"""
+        with app.app_context():
+            try:
+                refresh_log = RefreshLog.query.get(refresh_log_id)
+                if refresh_log.refresh_type == 'manual':
+                    run = RefreshService.manual_refresh
+                else:
+                    run = RefreshService.scheduled_refresh
+                run(refresh_log.keyword, max_results=max_results, mode=mode, refresh_log=refresh_log)
+            except Exception as e:
+                app.logger.error(f"Refresh job {refresh_log_id} crashed: {str(e)}")
+            finally:
+                db.session.remove()
+    
+    @staticmethod
+    def resume_orphaned_refreshes():
+        """启动时接管中断的刷新：状态仍为queued/running、但持有锁的进程已退出或租约已过期的刷新日志，
+        提交后台任务从断点继续。返回接管的刷新日志ID列表。"""
+        owner = process_owner()
+        app = current_app._get_current_object()
+        resumed = []
+        
+        for refresh_log in RefreshLog.query.filter(RefreshLog.status.in_(('queued', 'running'))).all():
+            lock = db.session.get(RefreshLock, RefreshLock.normalize(refresh_log.keyword))
+            if lock is not None and lock.refresh_log_id == refresh_log.id:
+                # 持有者进程已退出，或租约过期超过一个租约周期（持有者停止续期）时才接管，
+                # 其他进程中仍在运行的刷新只是续期稍有延迟时不会被重复执行
+                lease = timedelta(seconds=current_app.config.get('REFRESH_LOCK_LEASE_SECONDS', 900))
+                if RefreshService._lock_owner_alive(lock.owner) and lock.lease_expires_at >= china_now() - lease:
+                    continue
+                # 按原持有者做条件更新，多个进程同时启动时只有一个能接管
+                claimed = db.session.execute(
+                    update(RefreshLock)
+                    .where(
+                        RefreshLock.lock_key == lock.lock_key,
+                        RefreshLock.refresh_log_id == refresh_log.id,
+                        RefreshLock.owner == lock.owner
+                    )
+                    .values(
+                        owner=owner,
+                        lease_expires_at=china_now() + timedelta(
+                            seconds=current_app.config.get('REFRESH_LOCK_LEASE_SECONDS', 900)
+                        )
+                    )
+                ).rowcount
+                db.session.commit()
+                if not claimed:
+                    continue
+            else:
+                holder_id = RefreshService._acquire_refresh_lock(refresh_log.keyword, refresh_log.id)
+                if holder_id:
+                    refresh_log.status = 'failed'
+                    refresh_log.end_time = china_now()
+                    refresh_log.error_message = f'Interrupted; superseded by refresh {holder_id}'
+                    db.session.commit()
+                    continue
+            
+            checkpoint = refresh_log.checkpoint or {}
+            try:
+                get_refresh_executor().submit(
+                    RefreshService._run_job, app, refresh_log.id, checkpoint.get('max_results'), checkpoint.get('mode')
+                )
+            except RefreshQueueFull:
+                current_app.logger.warning(f"Refresh queue full, orphaned refresh {refresh_log.id} left for later")
+                break
+            current_app.logger.info(f"Resuming orphaned refresh {refresh_log.id} for keyword '{refresh_log.keyword}'")
+            resumed.append(refresh_log.id)
+        
+        return resumed
+    
+    @staticmethod
+    def _lock_owner_alive(owner):
+        """判断持有锁的进程是否仍在运行；其他主机上的进程无法判断，视为存活（以租约为准）"""
+        if owner == process_owner():
+            return True
+        host, _, pid = (owner or '').rpartition(':')
+        if ':' in host:
+            # 主机:进程号:启动标记
+            host, _, pid = host.rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit():
+            return True
+        if int(pid) == os.getpid():
+            # 进程号相同但启动标记不同，锁是上一个使用相同进程号的进程留下的
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    
+    @staticmethod
+    def manual_refresh(keyword=None, max_results=None, mode=None, refresh_log=None):
+        """手动刷新（refresh_log为enqueue_refresh创建的排队日志）"""
         if not keyword:
             keyword = current_app.config['DEFAULT_SEARCH_KEYWORD']
         
-        return RefreshService._perform_refresh('manual', keyword)
+        # 额度耗尽时按手动刷新的等待上限推迟，不长时间占用后台任务槽位
+        return RefreshService._perform_refresh(
+            'manual', keyword,
+            max_wait=current_app.config.get('GITHUB_RATE_LIMIT_MANUAL_MAX_WAIT', 0),
+            max_results=max_results,
+            mode=mode,
+            refresh_log=refresh_log
+        )
     
     @staticmethod
-    def scheduled_refresh(keyword=None):
+    def scheduled_refresh(keyword=None, max_results=None, mode=None, refresh_log=None):
         """定时刷新"""
         if not keyword:
             keyword = current_app.config['DEFAULT_SEARCH_KEYWORD']
-        return RefreshService._perform_refresh('scheduled', keyword)
+        return RefreshService._perform_refresh(
+            'scheduled', keyword, max_results=max_results, mode=mode, refresh_log=refresh_log
+        )
     
     @staticmethod
-    def _perform_refresh(refresh_type, keyword):
-        """执行刷新操作"""
-        start_time = china_now()
+    def _resolve_refresh_mode(keyword, mode=None):
+        """确定刷新模式：增量模式下返回上次成功刷新的开始时间，超过全量周期或无历史时回退为全量"""
+        mode = mode or current_app.config.get('REFRESH_MODE', 'full')
+        if mode != 'incremental':
+            return 'full', None
+        
+        last_success = RefreshLog.query.filter_by(keyword=keyword, status='success').order_by(
+            RefreshLog.start_time.desc()
+        ).first()
+        last_full = RefreshLog.query.filter_by(keyword=keyword, status='success', refresh_mode='full').order_by(
+            RefreshLog.start_time.desc()
+        ).first()
+        if not last_success or not last_full:
+            return 'full', None
+        
+        full_interval = timedelta(hours=current_app.config.get('INCREMENTAL_FULL_REFRESH_HOURS', 24))
+        if china_now() - last_full.start_time >= full_interval:
+            return 'full', None
+        
+        # 向前多取一段时间，覆盖上次刷新期间发生的推送
+        overlap = timedelta(minutes=current_app.config.get('INCREMENTAL_OVERLAP_MINUTES', 10))
+        return 'incremental', last_success.start_time - overlap
+    
+    @staticmethod
+    def _perform_refresh(refresh_type, keyword, max_wait=None, max_results=None, mode=None, refresh_log=None):
+        """执行刷新操作（refresh_log为已排队的刷新日志，未指定时新建）
+        
+        keyword为逗号分隔的多个关键词时作为批量刷新：各关键词并发抓取，跨关键词去重后写库。
+        refresh_log带有断点（中断的刷新）时沿用断点中的查询和分片计划，跳过已写入的分页。
+        """
+        keywords = split_keywords(keyword)
+        keyword = ','.join(keywords)
+        checkpoint = refresh_log.checkpoint if refresh_log is not None and refresh_log.checkpoint else None
+        resuming = bool(checkpoint and checkpoint.get('queries'))
+        if resuming:
+            refresh_mode = checkpoint['refresh_mode']
+            start_time = refresh_log.start_time
+        else:
+            refresh_mode, since = RefreshService._resolve_refresh_mode(keyword, mode)
+            start_time = china_now()
         
         # 创建刷新日志
-        refresh_log = RefreshLog(
-            refresh_type=refresh_type,
-            keyword=keyword,
-            start_time=start_time,
-            status='running'
-        )
-        db.session.add(refresh_log)
+        queued_log = refresh_log is not None
+        if refresh_log is None:
+            refresh_log = RefreshLog(refresh_type=refresh_type, keyword=keyword)
+            db.session.add(refresh_log)
+        refresh_log.start_time = start_time
+        refresh_log.status = 'running'
+        refresh_log.refresh_mode = refresh_mode
         db.session.commit()
         
+        # 同一关键词只运行一个刷新：锁被其他刷新持有时等待并返回它的结果
+        holder_id = RefreshService._acquire_refresh_lock(keyword, refresh_log.id)
+        if holder_id:
+            current_app.logger.info(f"Refresh for keyword '{keyword}' attached to in-flight refresh {holder_id}")
+            if queued_log:
+                # 排队期间锁租约过期并被其他刷新接管，保留本日志供调用方查询
+                refresh_log.status = 'failed'
+                refresh_log.end_time = china_now()
+                refresh_log.error_message = f'Superseded by in-flight refresh {holder_id}'
+                db.session.commit()
+                return refresh_log
+            db.session.delete(refresh_log)
+            db.session.commit()
+            return RefreshService._wait_for_refresh(keyword, holder_id)
+        heartbeat = RefreshLockHeartbeat(current_app._get_current_object(), keyword, refresh_log.id)
+        heartbeat.start()
+        
+        if resuming:
+            progress = RefreshProgress(refresh_log.pages_fetched or 0, refresh_log.metrics)
+        else:
+            progress = RefreshProgress()
         try:
+            if resuming:
+                max_results = checkpoint['max_results']
+                queries = dict(checkpoint['queries'])
+                current_app.logger.info(
+                    f"Resuming refresh {refresh_log.id} from checkpoint: "
+                    f"{len(checkpoint['pages'])} queries with written pages"
+                )
+            else:
+                if not max_results:
+                    max_results = current_app.config['MAX_RESULTS_PER_REQUEST']
+                
+                # 增量模式只查询上次刷新之后有推送的仓库
+                queries = {}
+                for item in keywords:
+                    queries[item] = item
+                    if refresh_mode == 'incremental':
+                        queries[item] = f"{item} pushed:>{china_to_utc_iso(since)}"
+                        current_app.logger.info(f"Incremental refresh: {queries[item]}")
+                
+                # 查询以列表保存（MySQL的JSON对象不保留键的顺序）
+                checkpoint = {
+                    'refresh_mode': refresh_mode,
+                    'max_results': max_results,
+                    'queries': [[item, query] for item, query in queries.items()],
+                    'plans': {},
+                    'pages': {}
+                }
+                refresh_log.checkpoint = checkpoint
+                db.session.commit()
+            
             # 获取GitHub数据
-            github_service = GitHubService()
-            max_results = current_app.config['MAX_RESULTS_PER_REQUEST']
-            repos_data = github_service.fetch_all_repositories(keyword, max_results)
+            github_service = GitHubService(
+                max_wait=max_wait, progress=progress,
+                checkpoint={'plans': dict(checkpoint['plans']), 'pages': dict(checkpoint['pages'])}
+            )
             
-            if repos_data:
-                # 保存到数据库
-                new_count, updated_count = ProjectService.save_projects(repos_data, refresh_log.id)
-                
+            keyword_stats = None
+            if len(queries) > 1:
+                # 关键词关系随分页逐批写入（分页带有抓取它的关键词），中断的刷新也保留已写入部分的关系
+                keyword_stats = {}
+                pages = github_service.iter_keyword_set_pages(queries, max_results, keyword_stats)
+                link_keywords = None
+            else:
+                pages = github_service.iter_keyword_pages(
+                    queries[keyword], max_results, written=refresh_log.total_fetched or 0
+                )
+                link_keywords = keywords
+            
+            # 边抓取边写库
+            totals = RefreshService._stream_to_store(
+                pages, refresh_log, progress, link_keywords, github_service.checkpoint
+            )
+            if keyword_stats is not None:
+                refresh_log.keyword_stats = keyword_stats
+                current_app.logger.info(f"Keyword set refresh stats: {keyword_stats}")
+            
+            if refresh_log.total_fetched or refresh_mode == 'incremental':
                 # 更新日志状态
                 refresh_log.end_time = china_now()
                 refresh_log.duration_seconds = int((refresh_log.end_time - start_time).total_seconds())
                 refresh_log.status = 'success'
-                refresh_log.total_fetched = len(repos_data)
-                refresh_log.new_projects = new_count
-                refresh_log.updated_projects = updated_count
+                refresh_log.checkpoint = None
                 
-                current_app.logger.info(f"Refresh completed: {new_count} new, {updated_count} updated")
+                current_app.logger.info(
+                    f"Refresh completed: {totals['new']} new, {totals['updated']} updated, "
+                    f"{totals['unchanged']} unchanged, {len(totals['failed'])} failed"
+                )
                 
             else:
                 refresh_log.status = 'failed'
                 refresh_log.error_message = 'Failed to fetch data from GitHub API'
+        
+        except RateLimitDeferred as e:
+            refresh_log.end_time = china_now()
+            refresh_log.duration_seconds = int((refresh_log.end_time - start_time).total_seconds())
+            refresh_log.status = 'deferred'
+            refresh_log.error_message = str(e)
+            current_app.logger.warning(f"Refresh deferred: {str(e)}")
                 
         except Exception as e:
             refresh_log.end_time = china_now()
@@ -373,13 +2296,237 @@ class RefreshService:
         
         finally:
             try:
+                refresh_log.api_requests_count = progress.requests
+                refresh_log.metrics = progress.metrics(
+                    refresh_log.total_fetched or 0, ((refresh_log.end_time or china_now()) - start_time).total_seconds()
+                )
                 db.session.commit()
             except Exception as e:
                 current_app.logger.error(f"Failed to save refresh log: {str(e)}")
                 db.session.rollback()
+            heartbeat.stop()
+            RefreshService._release_refresh_lock(keyword, refresh_log.id)
+            flush_api_stats()
         
         return refresh_log 
 
+    @staticmethod
+    def _acquire_refresh_lock(keyword, refresh_log_id):
+        """获取关键词的刷新锁：成功（或本来就由该刷新持有）返回None，否则返回持有锁的刷新日志ID
+        
+        锁记录已存在时，只有租约已过期才会被接管，崩溃进程留下的锁不会永久阻塞刷新。
+        """
+        lock_key = RefreshLock.normalize(keyword)
+        lease = timedelta(seconds=current_app.config.get('REFRESH_LOCK_LEASE_SECONDS', 900))
+        owner = process_owner()
+        
+        for _ in range(3):
+            now = china_now()
+            try:
+                with db.session.begin_nested():
+                    db.session.add(RefreshLock(
+                        lock_key=lock_key,
+                        refresh_log_id=refresh_log_id,
+                        owner=owner,
+                        acquired_at=now,
+                        lease_expires_at=now + lease
+                    ))
+                db.session.commit()
+                return None
+            except IntegrityError:
+                pass
+            
+            result = db.session.execute(
+                update(RefreshLock)
+                .where(
+                    RefreshLock.lock_key == lock_key,
+                    or_(RefreshLock.refresh_log_id == refresh_log_id, RefreshLock.lease_expires_at < now)
+                )
+                .values(refresh_log_id=refresh_log_id, owner=owner, acquired_at=now, lease_expires_at=now + lease)
+            )
+            holder_id = db.session.execute(
+                db.select(RefreshLock.refresh_log_id).where(RefreshLock.lock_key == lock_key)
+            ).scalar()
+            db.session.commit()
+            if result.rowcount:
+                current_app.logger.info(f"Refresh lock for '{lock_key}' taken over by refresh {refresh_log_id}")
+                return None
+            if holder_id is not None:
+                return holder_id
+            # 锁在两次查询之间被释放，重试插入
+        
+        raise RuntimeError(f"Unable to acquire refresh lock for keyword '{keyword}'")
+    
+    @staticmethod
+    def _renew_refresh_lock(keyword, refresh_log_id):
+        """续期刷新锁租约（由调用方提交），锁已不属于该刷新时返回False"""
+        lease = timedelta(seconds=current_app.config.get('REFRESH_LOCK_LEASE_SECONDS', 900))
+        result = db.session.execute(
+            update(RefreshLock)
+            .where(RefreshLock.lock_key == RefreshLock.normalize(keyword), RefreshLock.refresh_log_id == refresh_log_id)
+            .values(lease_expires_at=china_now() + lease)
+        )
+        return result.rowcount > 0
+    
+    @staticmethod
+    def _release_refresh_lock(keyword, refresh_log_id):
+        """释放刷新锁（只删除该刷新自己持有的锁）"""
+        try:
+            db.session.execute(
+                delete(RefreshLock)
+                .where(RefreshLock.lock_key == RefreshLock.normalize(keyword), RefreshLock.refresh_log_id == refresh_log_id)
+            )
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(f"Failed to release refresh lock for '{keyword}': {str(e)}")
+            db.session.rollback()
+    
+    @staticmethod
+    def _wait_for_refresh(keyword, refresh_log_id):
+        """等待进行中的刷新结束并返回其刷新日志；持有者的锁失效（崩溃或租约过期）时不再等待"""
+        lock_key = RefreshLock.normalize(keyword)
+        poll = current_app.config.get('REFRESH_LOCK_POLL_SECONDS', 2)
+        while True:
+            # 每轮结束事务，避免可重复读隔离级别下一直读到旧快照
+            db.session.commit()
+            refresh_log = db.session.get(RefreshLog, refresh_log_id)
+            if refresh_log is None or refresh_log.status not in ('queued', 'running'):
+                return refresh_log
+            lock = db.session.get(RefreshLock, lock_key)
+            if lock is None or lock.refresh_log_id != refresh_log_id or lock.lease_expires_at < china_now():
+                return refresh_log
+            time.sleep(poll)
+    
+    @staticmethod
+    def get_changes(refresh_log_id, after_id=None, limit=100, change_type=None):
+        """按id分页读取刷新的变更流水（keyset分页），返回 [(RefreshChange, GitHubProject)]"""
+        query = db.session.query(RefreshChange, GitHubProject).join(
+            GitHubProject, GitHubProject.id == RefreshChange.project_id
+        ).filter(RefreshChange.refresh_log_id == refresh_log_id)
+        if change_type:
+            query = query.filter(RefreshChange.change_type == change_type)
+        if after_id:
+            query = query.filter(RefreshChange.id > after_id)
+        return query.order_by(RefreshChange.id).limit(limit).all()
+    
+    @staticmethod
+    def _stream_to_store(pages, refresh_log, progress=None, keywords=None, checkpoint=None):
+        """流式刷新：抓取线程把分页放入有界队列，当前线程按批次写库，使网络与数据库耗时重叠
+        
+        checkpoint为抓取端共享的断点（分片计划），每批写库提交时连同各查询已写入的页码一起保存到刷新日志。
+        """
+        app = current_app._get_current_object()
+        batch_size = current_app.config.get('REFRESH_WRITE_BATCH_SIZE', 200)
+        page_queue = queue.Queue(maxsize=current_app.config.get('REFRESH_QUEUE_SIZE', 4))
+        stop = threading.Event()
+        done = object()
+        
+        def put(item):
+            # 写入端已停止时放弃，避免生产线程永久阻塞
+            while not stop.is_set():
+                try:
+                    page_queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce():
+            with app.app_context():
+                try:
+                    for page in pages:
+                        if not put(page):
+                            break
+                except BaseException as e:
+                    put(e)
+                finally:
+                    # 清理失败也必须通知写库端结束，否则写库线程会永久等待
+                    try:
+                        close = getattr(pages, 'close', None)
+                        if close:
+                            close()
+                    finally:
+                        put(done)
+        
+        producer = threading.Thread(target=produce, name=f'refresh-fetch-{refresh_log.id}', daemon=True)
+        producer.start()
+        
+        # 从断点恢复时在已有计数上累加
+        totals = {
+            'new': refresh_log.new_projects or 0,
+            'updated': refresh_log.updated_projects or 0,
+            'unchanged': refresh_log.unchanged_projects or 0,
+            'failed': list(refresh_log.failed_records or [])
+        }
+        batch = []
+        links = {}
+        written_pages = dict(checkpoint['pages']) if checkpoint else {}
+        received_pages = {}
+        
+        def flush(batch, links):
+            summary = ProjectService.save_projects(batch, refresh_log.id, keywords)
+            # 批量刷新的分页各自带有关键词，本批项目写入后再写对应关系（包括此前已写入、本批才被其他关键词找到的项目）
+            ProjectService.link_keyword_memberships(list(links.items()))
+            if progress:
+                progress.record('upsert', summary['seconds']['upsert'])
+                progress.record('commit', summary['seconds']['commit'])
+            for name in ('new', 'updated', 'unchanged', 'failed'):
+                totals[name] += summary[name]
+            # 逐批记录进度，中途失败时日志中仍保留已写入的数量
+            refresh_log.total_fetched = (refresh_log.total_fetched or 0) + len(batch)
+            refresh_log.new_projects = totals['new']
+            refresh_log.updated_projects = totals['updated']
+            refresh_log.unchanged_projects = totals['unchanged']
+            refresh_log.failed_projects = len(totals['failed'])
+            refresh_log.failed_records = totals['failed'][:RefreshLog.MAX_FAILED_RECORDS]
+            refresh_log.rows_written = totals['new'] + totals['updated']
+            if progress:
+                refresh_log.pages_fetched = progress.pages_fetched
+                refresh_log.total_pages = max(progress.total_pages, progress.pages_fetched)
+            if checkpoint:
+                # 队列按到达顺序消费，本批提交后此前收到的分页都已写入
+                written_pages.update(received_pages)
+                refresh_log.checkpoint = dict(
+                    refresh_log.checkpoint or {}, plans=dict(checkpoint['plans']), pages=dict(written_pages)
+                )
+            if progress:
+                refresh_log.api_requests_count = progress.requests
+                refresh_log.metrics = progress.metrics(
+                    refresh_log.total_fetched, (china_now() - refresh_log.start_time).total_seconds()
+                )
+            commit_start = time.perf_counter()
+            db.session.commit()
+            if progress:
+                progress.record('commit', time.perf_counter() - commit_start)
+        
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                item = page_queue.get()
+                if progress:
+                    progress.record('queue_wait', time.perf_counter() - wait_start)
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                batch.extend(item)
+                if isinstance(item, SearchPage):
+                    received_pages[item.query] = [item.page, item.last_page]
+                    if item.keyword:
+                        for owner_name in [(repo.owner, repo.name) for repo in item] + list(item.refound):
+                            links.setdefault(owner_name, set()).add(item.keyword)
+                if max(len(batch), len(links)) >= batch_size:
+                    flush(batch, links)
+                    batch = []
+                    links = {}
+            if batch or links:
+                flush(batch, links)
+        finally:
+            stop.set()
+            producer.join()
+        
+        return totals
+
 class SchedulerService:
     """定时器管理服务类"""
     
@@ -546,6 +2693,11 @@ class SchedulerService:
             for config in active_configs:
                 SchedulerService._add_scheduler_job(config)
             
+            # 已跟踪项目的GraphQL定时回填
+            rehydrate_hours = current_app.config.get('REHYDRATE_INTERVAL_HOURS', 0)
+            if rehydrate_hours:
+                SchedulerService._add_rehydrate_job(rehydrate_hours)
+            
             current_app.logger.info(f"Scheduler reloaded with {len(active_configs)} active configs")
             
         except Exception as e:
@@ -568,7 +2720,7 @@ class SchedulerService:
                     flask_app.logger.info(f"Starting scheduled task: {config.config_name}")
                     
                     # 执行刷新
-                    refresh_log = RefreshService.scheduled_refresh(config.keyword)
+                    refresh_log = RefreshService.scheduled_refresh(config.keyword, config.max_results)
                     
                     # 更新最后执行时间
                     from app.models import SchedulerConfig
@@ -618,6 +2770,32 @@ class SchedulerService:
             current_app.logger.error(f"Error adding scheduler job: {config.config_name}, error: {str(e)}")
             raise
     
+    @staticmethod
+    def _add_rehydrate_job(interval_hours):
+        """添加GraphQL批量回填任务"""
+        from app import scheduler as app_scheduler
+        
+        def rehydrate_task():
+            """回填任务执行函数"""
+            from app import create_minimal_app
+            flask_app = create_minimal_app()
+            
+            with flask_app.app_context():
+                try:
+                    summary = ProjectService.rehydrate_projects()
+                    flask_app.logger.info(f"Rehydrate task completed: {summary}")
+                except Exception as e:
+                    flask_app.logger.error(f"Rehydrate task failed: {str(e)}")
+        
+        app_scheduler.add_job(
+            func=rehydrate_task,
+            trigger='interval',
+            hours=interval_hours,
+            id='rehydrate_projects',
+            replace_existing=True
+        )
+        current_app.logger.info(f"Added rehydrate job, every {interval_hours} hours")
+    
     @staticmethod
     def get_scheduler_status():
         """获取调度器状态"""
@@ -662,8 +2840,8 @@ class SchedulerService:
             
             current_app.logger.info(f"Manual execution of config: {config.config_name}")
             
-            # 执行刷新
-            refresh_log = RefreshService.manual_refresh(config.keyword)
+            # 提交后台刷新任务
+            refresh_log = RefreshService.enqueue_refresh('manual', config.keyword, config.max_results)
             
             # 更新最后执行时间
             config.last_executed = china_now()
@@ -1,6 +1,8 @@
 import os
 from datetime import timedelta
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 class Config:
     # 应用配置
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'github-news-secret-key-2024'
@@ -21,13 +23,80 @@ class Config:
     }
     
     # GitHub API配置
-    GITHUB_API_BASE_URL = 'https://api.github.com'
+    # 可指向本地模拟服务（fake_github_server.py）做离线压测
+    GITHUB_API_BASE_URL = os.environ.get('GITHUB_API_BASE_URL', 'https://api.github.com').rstrip('/')
     GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')  # 可选，用于提高API限制
+    # 可选，多个Token用逗号分隔，请求按剩余额度在Token之间分配
+    GITHUB_TOKENS = [t.strip() for t in os.environ.get('GITHUB_TOKENS', '').split(',') if t.strip()]
+    
+    # GitHub HTTP连接池配置（进程内共享）
+    GITHUB_HTTP_POOL_CONNECTIONS = 4  # 连接池数量（按主机）
+    GITHUB_HTTP_POOL_MAXSIZE = 10  # 每个连接池最大连接数
+    GITHUB_HTTP_KEEP_ALIVE = True  # 是否保持长连接
+    GITHUB_HTTP_MAX_RETRIES = 3  # 建立连接失败时的传输层重试次数
+    GITHUB_HTTP_BACKOFF_FACTOR = 0.5  # 传输层重试退避因子(秒)
+    GITHUB_HTTP_TIMEOUT = 30  # 请求超时(秒)
+    
+    # GitHub请求重试与熔断配置
+    GITHUB_MAX_RETRIES = 3  # 5xx/超时/连接错误的重试次数
+    GITHUB_RETRY_BACKOFF = 1  # 指数退避基数(秒)，实际等待带随机抖动
+    GITHUB_RETRY_MAX_BACKOFF = 30  # 单次退避最长等待(秒)
+    GITHUB_SECONDARY_LIMIT_SECONDS = 60  # 次级限流未返回Retry-After时的停放时间(秒)
+    GITHUB_CIRCUIT_FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+    GITHUB_CIRCUIT_RESET_SECONDS = 30  # 熔断冷却时间(秒)
+    GITHUB_PAGE_RESUME_ATTEMPTS = 2  # 分页重试耗尽后，熔断冷却后从该分页继续的次数
+    
+    # GitHub搜索抓取配置
+    GITHUB_FETCH_WORKERS = 4  # 并发获取分页的线程数
+    GITHUB_SEARCH_RATE_PER_MINUTE = 30  # 每个Token的搜索API速率上限(认证用户30次/分钟)
+    GITHUB_SEARCH_BURST = 10  # 每个Token的令牌桶突发容量
+    
+    # GitHub限额调度配置
+    GITHUB_RATE_LIMIT_RESERVE = 0  # 剩余额度低于等于该值时停止发起请求
+    GITHUB_RATE_LIMIT_MAX_WAIT = 60  # 定时任务额度不足时最长等待(秒)，超过则推迟
+    GITHUB_RATE_LIMIT_MANUAL_MAX_WAIT = 0  # 手动刷新（后台任务）额度耗尽时最长等待(秒)，超过则推迟，避免长时间占用任务槽位
+    
+    # GitHub GraphQL配置（批量回填已跟踪项目，需要Token）
+    GITHUB_GRAPHQL_RATE_PER_MINUTE = 60  # 每个Token的GraphQL请求速率上限
+    GITHUB_GRAPHQL_BURST = 10
+    REHYDRATE_INTERVAL_HOURS = 0  # 定时回填间隔(小时)，0表示不启用
+    
+    # GitHub响应缓存配置（ETag条件请求，304不计入配额）
+    GITHUB_CACHE_ENABLED = True
+    GITHUB_CACHE_DIR = os.environ.get('GITHUB_CACHE_DIR') or os.path.join(basedir, 'cache', 'github')
+    GITHUB_CACHE_MAX_MB = 200  # 缓存目录最大容量(MB)，超出后按LRU淘汰
+    
+    # API统计计数缓冲：满足任一条件即批量写库，刷新结束和进程退出时也会写入
+    API_STATS_FLUSH_SECONDS = 10
+    API_STATS_FLUSH_REQUESTS = 100
+    
+    # GitHub请求录制目录（设置后每个请求/响应写入一个JSON文件，供fake_github_server.py --replay回放）
+    GITHUB_RECORD_DIR = os.environ.get('GITHUB_RECORD_DIR')
     
     # 定时任务配置
     REFRESH_INTERVAL_HOURS = 6  # 每6小时刷新一次
     DEFAULT_SEARCH_KEYWORD = 'AI'  # 默认搜索关键词
     MAX_RESULTS_PER_REQUEST = 1000  # GitHub API最大结果数
+    GITHUB_SEARCH_SHARDING = True  # 最大结果数超过1000时按stars/created范围分片查询
+    GITHUB_SHARD_WORKERS = 2  # 并发抓取的分片数
+    BATCH_REFRESH_WORKERS = 3  # 多关键词批量刷新（关键词以逗号分隔）时并发抓取的关键词数
+    GITHUB_SHARD_MAX_DEPTH = 24  # 分片递归拆分的最大深度
+    
+    # 增量刷新配置
+    REFRESH_MODE = os.environ.get('REFRESH_MODE', 'full')  # full=全量刷新，incremental=只抓取上次刷新后有推送的仓库
+    INCREMENTAL_FULL_REFRESH_HOURS = 24  # 增量模式下每隔多少小时回退执行一次全量刷新
+    INCREMENTAL_OVERLAP_MINUTES = 10  # 增量查询时间窗口向前重叠的分钟数
+    
+    # 流式刷新配置
+    REFRESH_QUEUE_SIZE = 4  # 抓取与写库之间的分页缓冲队列长度
+    REFRESH_WRITE_BATCH_SIZE = 200  # 每批写库的项目数
+    PROJECT_UPSERT_CHUNK_SIZE = 500  # 单条 INSERT ... ON DUPLICATE KEY UPDATE 语句包含的最大行数
+    REFRESH_JOB_WORKERS = 2  # 同时执行的后台刷新任务数
+    REFRESH_JOB_QUEUE_SIZE = 8  # 等待执行的后台刷新任务上限，超出后提交返回503
+    REFRESH_LOCK_LEASE_SECONDS = 900  # 刷新锁租约(秒)，运行中由心跳线程每1/3周期续期，进程崩溃后超时可被接管
+    REFRESH_LOCK_POLL_SECONDS = 2  # 同步调用合并到进行中的刷新时，轮询其结果的间隔(秒)
+    REFRESH_RESUME_ON_STARTUP = True  # 启动时从断点继续上次进程中断的刷新
+    PROJECT_TOUCH_UNCHANGED = True  # 内容未变化的项目是否批量更新last_fetched_at和fetch_count（False则完全不写）
     
     # 分页配置
     PROJECTS_PER_PAGE = 20
@@ -14,6 +14,7 @@ CREATE TABLE IF NOT EXISTS github_projects (
     owner VARCHAR(255) NOT NULL COMMENT '项目作者',
     description LONGTEXT COMMENT '项目简介',
     html_url VARCHAR(500) NOT NULL COMMENT 'GitHub项目地址',
+    node_id VARCHAR(100) COMMENT 'GitHub GraphQL节点ID',
     stars_count INT DEFAULT 0 COMMENT '星标数量',
     forks_count INT DEFAULT 0 COMMENT '分叉数量',
     watchers_count INT DEFAULT 0 COMMENT '关注者数量',
@@ -40,6 +41,7 @@ CREATE TABLE IF NOT EXISTS github_projects (
     local_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '本地更新时间',
     last_fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '最后抓取时间',
     fetch_count INT DEFAULT 1 COMMENT '抓取次数',
+    content_hash CHAR(40) COMMENT '跟踪字段的内容指纹(SHA1)',
     
     -- 索引
     UNIQUE KEY unique_project (name, owner),
@@ -50,6 +52,7 @@ CREATE TABLE IF NOT EXISTS github_projects (
     INDEX idx_updated_at (updated_at DESC),
     INDEX idx_created_at (created_at DESC),
     INDEX idx_local_updated (local_updated_at DESC),
+    INDEX idx_node_id (node_id),
     
     -- 全文搜索索引
     FULLTEXT KEY ft_search (name, owner, description)
@@ -63,19 +66,88 @@ CREATE TABLE IF NOT EXISTS refresh_logs (
     total_fetched INT DEFAULT 0 COMMENT '获取的项目总数',
     new_projects INT DEFAULT 0 COMMENT '新增项目数',
     updated_projects INT DEFAULT 0 COMMENT '更新项目数',
+    unchanged_projects INT DEFAULT 0 COMMENT '未变化项目数',
+    failed_projects INT DEFAULT 0 COMMENT '写入失败项目数',
+    failed_records JSON COMMENT '写入失败的项目及原因',
     start_time TIMESTAMP NOT NULL COMMENT '开始时间',
     end_time TIMESTAMP NULL COMMENT '结束时间',
     duration_seconds INT DEFAULT 0 COMMENT '耗时(秒)',
-    status ENUM('running', 'success', 'failed') DEFAULT 'running' COMMENT '状态',
+    status ENUM('queued', 'running', 'success', 'failed', 'deferred') DEFAULT 'running' COMMENT '状态',
     error_message TEXT COMMENT '错误信息',
     api_requests_count INT DEFAULT 0 COMMENT 'API请求次数',
+    refresh_mode ENUM('full', 'incremental') DEFAULT 'full' COMMENT '刷新模式',
+    pages_fetched INT DEFAULT 0 COMMENT '已抓取页数',
+    total_pages INT DEFAULT 0 COMMENT '预计总页数',
+    rows_written INT DEFAULT 0 COMMENT '已写入项目数',
+    keyword_stats JSON COMMENT '批量刷新中各关键词的抓取数/首次发现数/独有数',
+    checkpoint JSON COMMENT '刷新断点（查询、分片计划、各查询已写入的页码），成功后清空',
+    metrics JSON COMMENT '各阶段耗时、请求数、下载字节数、每秒写入行数、内存增量',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
     INDEX idx_refresh_type (refresh_type),
     INDEX idx_status (status),
-    INDEX idx_created_at (created_at DESC)
+    INDEX idx_created_at (created_at DESC),
+    INDEX idx_keyword_status (keyword, status, start_time)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='刷新日志表';
 
+-- 创建项目指标快照表（按天汇总，只在指标变化时写入）
+CREATE TABLE IF NOT EXISTS project_snapshots (
+    project_id INT NOT NULL COMMENT '项目ID',
+    snapshot_date DATE NOT NULL COMMENT '快照日期',
+    stars_count INT DEFAULT 0 COMMENT '星标数量',
+    forks_count INT DEFAULT 0 COMMENT '分叉数量',
+    open_issues_count INT DEFAULT 0 COMMENT '开放问题数量',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '当天最后一次写入时间',
+    
+    -- 聚簇主键：单个项目的星标曲线为一次主键范围扫描
+    PRIMARY KEY (project_id, snapshot_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='项目指标快照表';
+
+-- 创建刷新变更流水表（新增、星标变化、归档、恢复）
+CREATE TABLE IF NOT EXISTS refresh_changes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    refresh_log_id INT NOT NULL COMMENT '刷新日志ID',
+    project_id INT NOT NULL COMMENT '项目ID',
+    change_type ENUM('new', 'stars', 'archived', 'reactivated') NOT NULL COMMENT '变更类型',
+    stars_before INT COMMENT '变更前星标数',
+    stars_after INT COMMENT '变更后星标数',
+    stars_delta INT COMMENT '星标变化量',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_refresh_id (refresh_log_id, id),
+    INDEX idx_refresh_type (refresh_log_id, change_type, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='刷新变更流水表';
+
+-- 创建搜索关键词表
+CREATE TABLE IF NOT EXISTS search_keywords (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    keyword VARCHAR(255) NOT NULL COMMENT '规范化后的关键词',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    UNIQUE KEY unique_keyword (keyword)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='搜索关键词表';
+
+-- 创建项目关键词关系表（项目由哪些关键词的刷新抓取到）
+CREATE TABLE IF NOT EXISTS project_keywords (
+    keyword_id INT NOT NULL COMMENT '关键词ID',
+    project_id INT NOT NULL COMMENT '项目ID',
+    first_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '首次被该关键词抓取的时间',
+    last_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '最近一次被该关键词抓取的时间',
+    
+    -- 聚簇主键：某关键词下的项目为一次主键范围扫描
+    PRIMARY KEY (keyword_id, project_id),
+    INDEX idx_project_id (project_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='项目关键词关系表';
+
+-- 创建刷新锁表（同一关键词同时只运行一个刷新）
+CREATE TABLE IF NOT EXISTS refresh_locks (
+    lock_key VARCHAR(255) NOT NULL PRIMARY KEY COMMENT '规范化后的关键词',
+    refresh_log_id INT NOT NULL COMMENT '持有锁的刷新日志ID',
+    owner VARCHAR(255) COMMENT '持有锁的进程(主机:进程号:启动标记)',
+    acquired_at TIMESTAMP NOT NULL COMMENT '获得锁的时间',
+    lease_expires_at TIMESTAMP NOT NULL COMMENT '租约到期时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='刷新锁表';
+
 -- 创建系统配置表
 CREATE TABLE IF NOT EXISTS system_config (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -114,6 +186,24 @@ CREATE TABLE IF NOT EXISTS api_stats (
     INDEX idx_date (date DESC)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='API请求统计表';
 
+-- 创建Token维度API请求统计表
+CREATE TABLE IF NOT EXISTS api_token_stats (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    date DATE NOT NULL COMMENT '日期',
+    token_key VARCHAR(64) NOT NULL COMMENT 'Token标识(SHA256前缀)',
+    token_hint VARCHAR(20) COMMENT 'Token掩码',
+    total_requests INT DEFAULT 0 COMMENT '总请求数',
+    successful_requests INT DEFAULT 0 COMMENT '成功请求数',
+    failed_requests INT DEFAULT 0 COMMENT '失败请求数',
+    rate_limit_hits INT DEFAULT 0 COMMENT '触发限制次数',
+    last_remaining INT COMMENT '最近一次剩余额度',
+    last_reset_at INT COMMENT '最近一次额度重置时间(Unix时间戳)',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    
+    UNIQUE KEY unique_date_token (date, token_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Token维度API请求统计表';
+
 -- 创建定时器配置表
 CREATE TABLE IF NOT EXISTS `scheduler_config` (
     `id` INT(11) NOT NULL AUTO_INCREMENT,
@@ -0,0 +1,124 @@
+-- GitHub新闻项目数据库升级脚本
+-- 适用于已按旧版 create_tables.sql 建表的数据库，按顺序执行尚未执行过的部分
+
+USE github_news;
+
+-- 刷新日志新增 deferred 状态（GitHub API额度不足时推迟）
+ALTER TABLE refresh_logs
+    MODIFY COLUMN status ENUM('running', 'success', 'failed', 'deferred') DEFAULT 'running' COMMENT '状态';
+
+-- Token维度API请求统计表（多Token池）
+CREATE TABLE IF NOT EXISTS api_token_stats (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    date DATE NOT NULL COMMENT '日期',
+    token_key VARCHAR(64) NOT NULL COMMENT 'Token标识(SHA256前缀)',
+    token_hint VARCHAR(20) COMMENT 'Token掩码',
+    total_requests INT DEFAULT 0 COMMENT '总请求数',
+    successful_requests INT DEFAULT 0 COMMENT '成功请求数',
+    failed_requests INT DEFAULT 0 COMMENT '失败请求数',
+    rate_limit_hits INT DEFAULT 0 COMMENT '触发限制次数',
+    last_remaining INT COMMENT '最近一次剩余额度',
+    last_reset_at INT COMMENT '最近一次额度重置时间(Unix时间戳)',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    
+    UNIQUE KEY unique_date_token (date, token_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Token维度API请求统计表';
+
+-- 刷新日志记录刷新模式（增量刷新）
+ALTER TABLE refresh_logs
+    ADD COLUMN refresh_mode ENUM('full', 'incremental') DEFAULT 'full' COMMENT '刷新模式' AFTER api_requests_count,
+    ADD INDEX idx_keyword_status (keyword, status, start_time);
+
+-- 项目记录GraphQL节点ID（GraphQL批量回填）
+ALTER TABLE github_projects
+    ADD COLUMN node_id VARCHAR(100) COMMENT 'GitHub GraphQL节点ID' AFTER html_url,
+    ADD INDEX idx_node_id (node_id);
+
+-- 项目记录内容指纹（刷新时按批预加载已有项目）
+ALTER TABLE github_projects
+    ADD COLUMN content_hash CHAR(40) COMMENT '跟踪字段的内容指纹(SHA1)' AFTER fetch_count;
+
+-- 刷新日志记录未变化项目数（跳过内容未变化的项目）
+ALTER TABLE refresh_logs
+    ADD COLUMN unchanged_projects INT DEFAULT 0 COMMENT '未变化项目数' AFTER updated_projects;
+
+-- 刷新日志记录写入失败的项目（保存点隔离出错记录）
+ALTER TABLE refresh_logs
+    ADD COLUMN failed_projects INT DEFAULT 0 COMMENT '写入失败项目数' AFTER unchanged_projects,
+    ADD COLUMN failed_records JSON COMMENT '写入失败的项目及原因' AFTER failed_projects;
+
+-- 项目指标快照表（星标历史）
+CREATE TABLE IF NOT EXISTS project_snapshots (
+    project_id INT NOT NULL COMMENT '项目ID',
+    snapshot_date DATE NOT NULL COMMENT '快照日期',
+    stars_count INT DEFAULT 0 COMMENT '星标数量',
+    forks_count INT DEFAULT 0 COMMENT '分叉数量',
+    open_issues_count INT DEFAULT 0 COMMENT '开放问题数量',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '当天最后一次写入时间',
+    
+    PRIMARY KEY (project_id, snapshot_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='项目指标快照表';
+
+-- 刷新变更流水表
+CREATE TABLE IF NOT EXISTS refresh_changes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    refresh_log_id INT NOT NULL COMMENT '刷新日志ID',
+    project_id INT NOT NULL COMMENT '项目ID',
+    change_type ENUM('new', 'stars', 'archived', 'reactivated') NOT NULL COMMENT '变更类型',
+    stars_before INT COMMENT '变更前星标数',
+    stars_after INT COMMENT '变更后星标数',
+    stars_delta INT COMMENT '星标变化量',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_refresh_id (refresh_log_id, id),
+    INDEX idx_refresh_type (refresh_log_id, change_type, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='刷新变更流水表';
+
+-- 后台刷新任务：排队状态与进度字段
+ALTER TABLE refresh_logs
+    MODIFY COLUMN status ENUM('queued', 'running', 'success', 'failed', 'deferred') DEFAULT 'running' COMMENT '状态',
+    ADD COLUMN pages_fetched INT DEFAULT 0 COMMENT '已抓取页数' AFTER refresh_mode,
+    ADD COLUMN total_pages INT DEFAULT 0 COMMENT '预计总页数' AFTER pages_fetched,
+    ADD COLUMN rows_written INT DEFAULT 0 COMMENT '已写入项目数' AFTER total_pages;
+
+-- 刷新锁表（同一关键词的并发刷新合并为一个）
+CREATE TABLE IF NOT EXISTS refresh_locks (
+    lock_key VARCHAR(255) NOT NULL PRIMARY KEY COMMENT '规范化后的关键词',
+    refresh_log_id INT NOT NULL COMMENT '持有锁的刷新日志ID',
+    owner VARCHAR(255) COMMENT '持有锁的进程(主机:进程号:启动标记)',
+    acquired_at TIMESTAMP NOT NULL COMMENT '获得锁的时间',
+    lease_expires_at TIMESTAMP NOT NULL COMMENT '租约到期时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='刷新锁表';
+
+-- 多关键词批量刷新：各关键词的子统计
+ALTER TABLE refresh_logs
+    ADD COLUMN keyword_stats JSON COMMENT '批量刷新中各关键词的抓取数/首次发现数/独有数' AFTER rows_written;
+
+-- 项目关键词索引（按抓取到项目的关键词筛选）
+CREATE TABLE IF NOT EXISTS search_keywords (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    keyword VARCHAR(255) NOT NULL COMMENT '规范化后的关键词',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    UNIQUE KEY unique_keyword (keyword)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='搜索关键词表';
+
+CREATE TABLE IF NOT EXISTS project_keywords (
+    keyword_id INT NOT NULL COMMENT '关键词ID',
+    project_id INT NOT NULL COMMENT '项目ID',
+    first_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '首次被该关键词抓取的时间',
+    last_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '最近一次被该关键词抓取的时间',
+    
+    -- 聚簇主键：某关键词下的项目为一次主键范围扫描
+    PRIMARY KEY (keyword_id, project_id),
+    INDEX idx_project_id (project_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='项目关键词关系表';
+
+-- 可恢复的刷新断点
+ALTER TABLE refresh_logs
+    ADD COLUMN checkpoint JSON COMMENT '刷新断点（查询、分片计划、各查询已写入的页码），成功后清空' AFTER keyword_stats;
+
+-- 刷新各阶段耗时与资源统计
+ALTER TABLE refresh_logs
+    ADD COLUMN metrics JSON COMMENT '各阶段耗时、请求数、下载字节数、每秒写入行数、内存增量' AFTER checkpoint;
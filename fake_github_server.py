@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+本地GitHub API模拟服务
+用于在无网络环境下压测和回归测试刷新流程，支持两种模式：
+  - 生成模式：按随机种子生成固定的仓库集合，模拟搜索分页、total_count、限流响应头、
+    ETag/304，以及可配置的延迟、5xx和次级限流注入
+  - 回放模式：回放GITHUB_RECORD_DIR录制的真实请求/响应
+
+使用方法：
+    python fake_github_server.py --port 5005 --repos 20000 --latency 0.2 --error-rate 0.02
+    GITHUB_API_BASE_URL=http://127.0.0.1:5005 python run.py
+"""
+
+import argparse
+import hashlib
+import json
+import operator
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from flask import Flask, jsonify, request
+
+LANGUAGES = ['Python', 'JavaScript', 'TypeScript', 'Go', 'Rust', 'Java', 'C++', 'Jupyter Notebook', None]
+TOPICS = ['ai', 'machine-learning', 'llm', 'deep-learning', 'nlp', 'computer-vision', 'agent', 'chatbot']
+LICENSES = [None, 'MIT License', 'Apache License 2.0', 'GNU General Public License v3.0']
+
+# GitHub搜索只返回前1000条结果
+SEARCH_RESULT_CAP = 1000
+
+def parse_time(value):
+    """规范化时间限定值：纯日期保持YYYY-MM-DD，其余转换为UTC的YYYY-MM-DDTHH:MM:SSZ，均可与仓库时间按字符串比较"""
+    if len(value) == 10:
+        return value
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def parse_qualifier(value, parse, project=lambda x, bound: x):
+    """把 a..b / >=a / >a / <=a / <a / a 形式的限定条件转换为判断函数（project按边界值截取比较对象）"""
+    if '..' in value:
+        low, high = value.split('..', 1)
+        low = None if low in ('', '*') else parse(low)
+        high = None if high in ('', '*') else parse(high)
+        return lambda x: ((low is None or project(x, low) >= low)
+                          and (high is None or project(x, high) <= high))
+    for prefix, compare in (('>=', operator.ge), ('<=', operator.le), ('>', operator.gt), ('<', operator.lt)):
+        if value.startswith(prefix):
+            bound = parse(value[len(prefix):])
+            return lambda x: compare(project(x, bound), bound)
+    bound = parse(value)
+    return lambda x: project(x, bound) == bound
+
+def truncate_time(repo_time, bound):
+    """与纯日期比较时只取仓库时间的日期部分，使日期上限包含当天"""
+    return repo_time[:len(bound)]
+
+class FakeGitHub:
+    """生成模式的仓库集合与搜索逻辑"""
+
+    def __init__(self, repos=5000, seed=42):
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        start = datetime(2010, 1, 1, tzinfo=timezone.utc)
+        self.repos = []
+        for index in range(repos):
+            created_at = start + timedelta(seconds=rng.randint(0, int((now - start).total_seconds())))
+            pushed_at = created_at + timedelta(seconds=rng.randint(0, int((now - created_at).total_seconds())))
+            owner = f'owner{rng.randint(0, repos // 5 + 1)}'
+            license_name = rng.choice(LICENSES)
+            name = f'ai-project-{index}'
+            self.repos.append({
+                'id': 100000 + index,
+                'node_id': f'R_fake{index}',
+                'name': name,
+                'full_name': f'{owner}/{name}',
+                'owner': {'login': owner},
+                'html_url': f'https://github.com/{owner}/{name}',
+                'description': f'Synthetic AI repository #{index}',
+                'stargazers_count': min(int(rng.paretovariate(0.9)) - 1, 500000),
+                'forks_count': rng.randint(0, 500),
+                'watchers_count': rng.randint(0, 500),
+                'language': rng.choice(LANGUAGES),
+                'topics': rng.sample(TOPICS, rng.randint(0, 3)),
+                'license': {'name': license_name} if license_name else None,
+                'created_at': created_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'updated_at': pushed_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'pushed_at': pushed_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'size': rng.randint(1, 100000),
+                'open_issues_count': rng.randint(0, 200),
+                'archived': rng.random() < 0.05,
+                'disabled': False
+            })
+        self.by_node_id = {repo['node_id']: repo for repo in self.repos}
+        self.by_name = {repo['full_name'].lower(): repo for repo in self.repos}
+
+    def search(self, q, sort='stars', order='desc'):
+        """按查询中的stars/created/pushed限定条件过滤（关键词部分不参与过滤）"""
+        predicates = []
+        for term in q.split():
+            qualifier, _, value = term.partition(':')
+            if not value:
+                continue
+            if qualifier == 'stars':
+                check = parse_qualifier(value, int)
+                predicates.append(lambda repo, check=check: check(repo['stargazers_count']))
+            elif qualifier in ('created', 'pushed'):
+                check = parse_qualifier(value, parse_time, truncate_time)
+                field = f'{qualifier}_at'
+                predicates.append(lambda repo, check=check, field=field: check(repo[field]))
+        results = [repo for repo in self.repos if all(predicate(repo) for predicate in predicates)]
+        key = {'stars': 'stargazers_count', 'forks': 'forks_count', 'updated': 'updated_at'}.get(sort, 'stargazers_count')
+        results.sort(key=lambda repo: (repo[key], repo['id']), reverse=(order != 'asc'))
+        return results
+
+def graphql_node(repo):
+    """转换为GraphQL RepoFields片段的结构"""
+    return {
+        'id': repo['node_id'],
+        'name': repo['name'],
+        'nameWithOwner': repo['full_name'],
+        'owner': repo['owner'],
+        'description': repo['description'],
+        'stargazerCount': repo['stargazers_count'],
+        'forkCount': repo['forks_count'],
+        'watchers': {'totalCount': repo['watchers_count']},
+        'primaryLanguage': {'name': repo['language']} if repo['language'] else None,
+        'repositoryTopics': {'nodes': [{'topic': {'name': topic}} for topic in repo['topics']]},
+        'licenseInfo': repo['license'],
+        'updatedAt': repo['updated_at'],
+        'pushedAt': repo['pushed_at'],
+        'diskUsage': repo['size'],
+        'issues': {'totalCount': repo['open_issues_count']},
+        'pullRequests': {'totalCount': 0},
+        'isArchived': repo['archived'],
+        'isDisabled': repo['disabled']
+    }
+
+class RateLimiter:
+    """按Token（匿名时按客户端地址）和资源类型计数的固定窗口限流"""
+
+    def __init__(self, limits):
+        self.limits = limits  # {resource: (limit, window_seconds)}
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def hit(self, resource, client, count=True):
+        """返回 (allowed, headers)；count=False时只读取当前状态"""
+        limit, window = self.limits[resource]
+        now = time.time()
+        with self.lock:
+            reset_at, used = self.windows.get((resource, client), (0, 0))
+            if now >= reset_at:
+                reset_at, used = int(now) + window, 0
+            allowed = used < limit
+            if allowed and count:
+                used += 1
+            self.windows[(resource, client)] = (reset_at, used)
+        headers = {
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Remaining': str(max(0, limit - used)),
+            'X-RateLimit-Reset': str(reset_at),
+            'X-RateLimit-Used': str(used),
+            'X-RateLimit-Resource': resource
+        }
+        return allowed, headers
+
+class Replayer:
+    """回放录制的请求：同一请求按录制顺序依次返回，最后一条重复使用"""
+
+    def __init__(self, record_dir):
+        self.lock = threading.Lock()
+        self.responses = defaultdict(deque)
+        files = sorted(name for name in os.listdir(record_dir) if name.endswith('.json'))
+        latest_ok = {}
+        for name in files:
+            with open(os.path.join(record_dir, name), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            req = entry['request']
+            key = self.key(req['method'], req['path'], req['params'], req['body'])
+            response = dict(entry['response'], recorded_at=entry['recorded_at'])
+            if response['status'] == 200:
+                latest_ok[key] = response
+            elif response['status'] == 304:
+                # 304没有正文，回放时替换为同一请求最近的200响应，再按客户端ETag判断是否返回304
+                response = latest_ok.get(key)
+                if response is None:
+                    continue
+            self.responses[key].append(response)
+        print(f"已加载 {len(files)} 条录制记录，{len(self.responses)} 个不同请求")
+
+    @staticmethod
+    def key(method, path, params, body):
+        raw = json.dumps([method.upper(), path, sorted((params or {}).items()), body], sort_keys=True)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def next(self, key):
+        with self.lock:
+            responses = self.responses.get(key)
+            if not responses:
+                return None
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+def create_fake_app(options):
+    """创建模拟服务应用（options为argparse.Namespace，也可供压测脚本在进程内直接使用）"""
+    app = Flask('fake_github')
+    rng = random.Random(options.seed)
+    rng_lock = threading.Lock()
+    stats = defaultdict(int)
+    stats_lock = threading.Lock()
+    fake = None if options.replay else FakeGitHub(options.repos, options.seed)
+    replayer = Replayer(options.replay) if options.replay else None
+    limiter = RateLimiter({
+        'search': (options.search_limit, 60),
+        'graphql': (options.graphql_limit, 3600),
+        'core': (5000, 3600)
+    })
+
+    def chance(rate):
+        with rng_lock:
+            return rate > 0 and rng.random() < rate
+
+    def client_id():
+        return request.headers.get('Authorization') or request.remote_addr
+
+    @app.before_request
+    def simulate_latency():
+        if request.path.startswith('/_fake'):
+            return None
+        with stats_lock:
+            stats['requests'] += 1
+        delay = options.latency
+        if options.jitter:
+            with rng_lock:
+                delay += rng.uniform(0, options.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        # 注入故障：5xx与次级限流
+        if chance(options.error_rate):
+            return jsonify({'message': 'Server Error'}), 502
+        if chance(options.secondary_rate):
+            response = jsonify({'message': 'You have exceeded a secondary rate limit. Please wait a few minutes before you try again.'})
+            response.status_code = 403
+            response.headers['Retry-After'] = str(options.retry_after)
+            return response
+        return None
+
+    @app.after_request
+    def count_status(response):
+        if not request.path.startswith('/_fake'):
+            with stats_lock:
+                stats[f'status_{response.status_code}'] += 1
+        return response
+
+    def rate_limited(resource, count=True):
+        allowed, headers = limiter.hit(resource, client_id(), count)
+        if allowed:
+            return None, headers
+        response = jsonify({
+            'message': 'API rate limit exceeded for this client.',
+            'documentation_url': 'https://docs.github.com/rest/overview/resources-in-the-rest-api#rate-limiting'
+        })
+        response.status_code = 403
+        response.headers.update(headers)
+        return response, headers
+
+    def replay():
+        """回放模式：按请求匹配录制的响应，并把限流重置时间平移到当前"""
+        body = request.get_json(silent=True) if request.method == 'POST' else None
+        key = Replayer.key(request.method, request.path, request.args.to_dict(), body)
+        recorded = replayer.next(key)
+        if recorded is None:
+            return jsonify({'message': 'No recorded response for this request'}), 404
+        headers = dict(recorded['headers'])
+        if 'X-RateLimit-Reset' in headers:
+            shift = int(time.time() - recorded['recorded_at'])
+            headers['X-RateLimit-Reset'] = str(int(headers['X-RateLimit-Reset']) + shift)
+        if recorded['status'] == 200 and headers.get('ETag') and request.headers.get('If-None-Match') == headers['ETag']:
+            return '', 304, headers
+        return recorded['body'], recorded['status'], headers
+
+    @app.route('/search/repositories')
+    def search_repositories():
+        if replayer:
+            return replay()
+
+        q = request.args.get('q', '')
+        sort = request.args.get('sort', 'stars')
+        order = request.args.get('order', 'desc')
+        per_page = min(int(request.args.get('per_page', 30)), 100)
+        page = int(request.args.get('page', 1))
+
+        # 与GitHub一致：携带Token的条件请求命中304时不消耗额度
+        etag = 'W/"{}"'.format(hashlib.sha1(f'{options.seed}:{q}:{sort}:{order}:{per_page}:{page}'.encode('utf-8')).hexdigest())
+        if request.headers.get('Authorization') and request.headers.get('If-None-Match') == etag:
+            _, headers = rate_limited('search', count=False)
+            return '', 304, dict(headers, ETag=etag)
+
+        error, headers = rate_limited('search')
+        if error is not None:
+            return error
+        if page * per_page > SEARCH_RESULT_CAP:
+            return jsonify({'message': 'Only the first 1000 search results are available'}), 422, headers
+
+        results = fake.search(q, sort, order)
+        visible = results[:SEARCH_RESULT_CAP]
+        start = (page - 1) * per_page
+        items = [dict(repo, score=1.0) for repo in visible[start:start + per_page]]
+        response = jsonify({'total_count': len(results), 'incomplete_results': False, 'items': items})
+        response.headers.update(headers)
+        response.headers['ETag'] = etag
+        last_page = max(1, -(-len(visible) // per_page))
+        if page < last_page:
+            response.headers['Link'] = (
+                f'<{request.base_url}?q={q}&per_page={per_page}&page={page + 1}>; rel="next", '
+                f'<{request.base_url}?q={q}&per_page={per_page}&page={last_page}>; rel="last"'
+            )
+        return response
+
+    @app.route('/graphql', methods=['POST'])
+    def graphql():
+        if replayer:
+            return replay()
+        if not request.headers.get('Authorization'):
+            return jsonify({'message': 'This endpoint requires you to be authenticated.'}), 401
+        error, headers = rate_limited('graphql')
+        if error is not None:
+            return error
+
+        # 只支持刷新服务使用的两种查询：nodes(ids:) 批量查询与 rN: repository(owner, name) 别名查询
+        body = request.get_json(silent=True) or {}
+        query = body.get('query', '')
+        data = {}
+        if 'nodes(ids' in query:
+            data['nodes'] = [
+                graphql_node(fake.by_node_id[node_id]) if node_id in fake.by_node_id else None
+                for node_id in (body.get('variables') or {}).get('ids', [])
+            ]
+        for alias, owner, name in re.findall(r'(\w+): repository\(owner: "(.*?)", name: "(.*?)"\)', query):
+            repo = fake.by_name.get(f'{owner}/{name}'.lower())
+            data[alias] = graphql_node(repo) if repo else None
+        response = jsonify({'data': data})
+        response.headers.update(headers)
+        return response
+
+    @app.route('/rate_limit')
+    def rate_limit():
+        if replayer:
+            return replay()
+        resources = {}
+        for resource in ('core', 'search', 'graphql'):
+            _, headers = limiter.hit(resource, client_id(), count=False)
+            resources[resource] = {
+                'limit': int(headers['X-RateLimit-Limit']),
+                'remaining': int(headers['X-RateLimit-Remaining']),
+                'reset': int(headers['X-RateLimit-Reset']),
+                'used': int(headers['X-RateLimit-Used'])
+            }
+        return jsonify({'resources': resources, 'rate': resources['core']})
+
+    @app.route('/_fake/stats', methods=['GET', 'DELETE'])
+    def fake_stats():
+        """模拟服务自身的请求计数，DELETE清零（便于每轮压测前重置）"""
+        with stats_lock:
+            snapshot = dict(stats)
+            if request.method == 'DELETE':
+                stats.clear()
+        return jsonify(snapshot)
+
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='本地GitHub API模拟服务')
+    parser.add_argument('--host', default=os.environ.get('FAKE_GITHUB_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('FAKE_GITHUB_PORT', 5005)))
+    parser.add_argument('--repos', type=int, default=5000, help='生成的仓库数量')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子，相同种子生成相同数据')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的固定延迟(秒)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='额外的随机延迟上限(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回502的概率')
+    parser.add_argument('--secondary-rate', type=float, default=0.0, help='返回次级限流403的概率')
+    parser.add_argument('--retry-after', type=int, default=5, help='次级限流的Retry-After(秒)')
+    parser.add_argument('--search-limit', type=int, default=30, help='每个Token每分钟的搜索额度')
+    parser.add_argument('--graphql-limit', type=int, default=5000, help='每个Token每小时的GraphQL额度')
+    parser.add_argument('--replay', help='回放GITHUB_RECORD_DIR录制的目录（忽略生成参数）')
+    return parser.parse_args(argv)
+
+def main():
+    """主函数"""
+    options = parse_args()
+    app = create_fake_app(options)
+
+    print(f"=== GitHub API模拟服务 ===")
+    print(f"模式: {'回放 ' + options.replay if options.replay else f'生成 {options.repos} 个仓库'}")
+    print(f"地址: http://{options.host}:{options.port}")
+    print(f"使用: GITHUB_API_BASE_URL=http://{options.host}:{options.port}")
+    print("=" * 30)
+
+    try:
+        app.run(host=options.host, port=options.port, debug=False, threaded=True)
+    except KeyboardInterrupt:
+        print("\n模拟服务已停止")
+
+if __name__ == '__main__':
+    main()